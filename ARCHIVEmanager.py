@@ -0,0 +1,190 @@
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+import GPXcleaner as gc
+import JSONLhelper as jh
+
+
+ARCHIVE_FILE = 'trackpoints.bin'
+INDEX_SUFFIX = '.index.jsonl'
+
+# fixed-width trackpoint record; `time` is UTC epoch nanoseconds so it can be
+# viewed as datetime64[ns] without copying
+TRACKPOINT_DTYPE = np.dtype([
+    ('latitude', '<f4'),
+    ('longitude', '<f4'),
+    ('elevation', '<f4'),
+    ('time', '<i8'),
+    ('heart_rate', 'u1'),
+    ('cadence', 'u1'),
+    ('power', '<u2'),
+])
+
+# sentinel stored for missing integer channels
+MISSING = {
+    'heart_rate': np.iinfo(np.uint8).max,
+    'cadence': np.iinfo(np.uint8).max,
+    'power': np.iinfo(np.uint16).max,
+}
+
+# held while records and their index entry are appended, so an offset is
+# never taken before another thread's records have landed
+_append_lock = threading.Lock()
+
+
+def index_path(archive_path):
+    return f'{archive_path}{INDEX_SUFFIX}'
+
+
+def frame_to_records(gpx_df):
+    '''
+    Convert enriched activity frame to TRACKPOINT_DTYPE records
+
+    Parameters
+    ----------
+    gpx_df: pandas.DataFrame
+        frame returned by GPXmanager.raw_gpx_to_reuben_gpx
+
+    Returns
+    -------
+    numpy.ndarray
+        structured array of TRACKPOINT_DTYPE
+    '''
+    records = np.zeros(gpx_df.shape[0], dtype=TRACKPOINT_DTYPE)
+    for col in ['latitude', 'longitude', 'elevation']:
+        records[col] = gpx_df[col].to_numpy(dtype=np.float32) if col in gpx_df else np.nan
+    records['time'] = gc.get_utc_time(gpx_df).dt.tz_convert(None).to_numpy(dtype='datetime64[ns]').view(np.int64)
+    for col, missing in MISSING.items():
+        values = gpx_df[col].to_numpy(dtype=np.float64, na_value=np.nan) if col in gpx_df else np.full(gpx_df.shape[0], np.nan)
+        records[col] = np.where(
+            np.isnan(values), missing,
+            np.clip(np.round(values), 0, missing - 1)
+        )
+    return records
+
+
+def write_activity_archive(gpx_df, archive_path):
+    '''
+    Append one activity to the archive and record its offset; re-written
+    activities are appended again and the index points at the newest copy
+    (see compact_archive)
+
+    Parameters
+    ----------
+    gpx_df: pandas.DataFrame
+        frame returned by GPXmanager.raw_gpx_to_reuben_gpx
+    archive_path: str
+        path to archive, typically <backup_dir>/ARCHIVE_FILE
+    '''
+    activity_id = str(gc.get_activity_id(gpx_df))
+    records = frame_to_records(gpx_df)
+
+    with _append_lock:
+        with open(archive_path, 'ab') as f:
+            # an interrupted append may have left a partial record; drop it
+            # so the new activity starts on a record boundary
+            size = f.tell()
+            offset, partial = divmod(size, TRACKPOINT_DTYPE.itemsize)
+            if partial:
+                f.truncate(size - partial)
+            f.write(records.tobytes())
+        # data is written before its index entry, so an interrupted append
+        # leaves only unreferenced records behind
+        jh.append_entry(index_path(archive_path), {'activity_id': activity_id, 'offset': offset, 'count': len(records)})
+
+
+def load_index(archive_path):
+    '''
+    Activity offsets in the archive
+
+    Returns
+    -------
+    dict
+        keys: activity ID (str)
+        vals: tuple(offset, count) in records
+    '''
+    return {
+        activity_id: (entry['offset'], entry['count'])
+        for activity_id, entry in jh.read_entries(index_path(archive_path)).items()
+    }
+
+
+def open_archive(archive_path):
+    '''
+    Memory-map the archive and load its index
+
+    Parameters
+    ----------
+    archive_path: str
+        path to archive
+
+    Returns
+    -------
+    tuple(numpy.memmap, dict)
+        read-only records and index returned by load_index
+    '''
+    # a trailing partial record from an interrupted append is ignored
+    records = os.path.getsize(archive_path) // TRACKPOINT_DTYPE.itemsize if os.path.isfile(archive_path) else 0
+    if not records:
+        return np.zeros(0, dtype=TRACKPOINT_DTYPE), {}
+    return np.memmap(archive_path, dtype=TRACKPOINT_DTYPE, mode='r', shape=(records,)), load_index(archive_path)
+
+
+def read_activity(archive, index, activity_id):
+    '''
+    Zero-copy view of one activity's records
+
+    Parameters
+    ----------
+    archive, index:
+        returned by open_archive
+    activity_id: str or int
+
+    Returns
+    -------
+    numpy.memmap
+        structured records of TRACKPOINT_DTYPE; `records['time'].view('datetime64[ns]')`
+        gives timestamps without copying
+    '''
+    offset, count = index[str(activity_id)]
+    return archive[offset:offset + count]
+
+
+def records_to_frame(records):
+    '''
+    Copy records into a pandas.DataFrame, restoring NaN for missing channels
+    '''
+    records_df = pd.DataFrame({
+        'latitude': records['latitude'],
+        'longitude': records['longitude'],
+        'elevation': records['elevation'],
+        'time': pd.to_datetime(records['time'].view('datetime64[ns]'), utc=True),
+    })
+    for col, missing in MISSING.items():
+        records_df[col] = pd.Series(records[col]).where(records[col] != missing).astype('float32')
+    return records_df
+
+
+def compact_archive(archive_path):
+    '''
+    Rewrite archive keeping only the newest copy of every activity
+    '''
+    with _append_lock:
+        archive, index = open_archive(archive_path)
+        compact_path = f'{archive_path}.tmp'
+
+        offset = 0
+        compact_index = []
+        with open(compact_path, 'wb') as f:
+            for activity_id, (start, count) in index.items():
+                f.write(archive[start:start + count].tobytes())
+                compact_index.append({'activity_id': activity_id, 'offset': offset, 'count': count})
+                offset += count
+        jh.write_entries(index_path(compact_path), compact_index)
+
+        del archive
+        os.replace(compact_path, archive_path)
+        os.replace(index_path(compact_path), index_path(archive_path))
@@ -1,9 +1,107 @@
 import os
 
-from pandas import read_csv, concat
+from pandas import read_csv, concat, to_datetime
 
+import PARQUETmanager as pm
+import SCANhelper as sh
+import TIMEhelper as th
+from JSONmanager import drop_zero_cols
 
-def gather_activities_data(export_dir, backup_dir):
+
+# columns of gcexport's activities.csv that are backed up, and their dtypes;
+# `Start Time` is parsed to datetime64 and `Activity Type` made categorical
+CSV_SCHEMA = {
+    'Activity ID': 'int64',
+    'Activity Name': 'object',
+    'Description': 'object',
+    'Start Time': 'object',
+    'End Time': 'object',
+    'Location Name': 'object',
+    'Time Zone': 'object',
+    'Activity Type': 'object',
+    'Activity Parent': 'object',
+    'Event Type': 'object',
+    'Device': 'object',
+    'Gear': 'object',
+    'Duration (h:m:s)': 'object',
+    'Duration (s)': 'float64',
+    'Moving Duration (h:m:s)': 'object',
+    'Moving Duration (s)': 'float64',
+    'Distance (km)': 'float64',
+    'Average Speed (km/h)': 'float64',
+    'Average Moving Speed (km/h)': 'float64',
+    'Max. Speed (km/h)': 'float64',
+    'Elevation Loss (m)': 'float64',
+    'Elevation Gain (m)': 'float64',
+    'Elevation Min. (m)': 'float64',
+    'Elevation Max. (m)': 'float64',
+    'Min. HR': 'float64',
+    'Max. HR': 'float64',
+    'Average HR': 'float64',
+    'Calories': 'float64',
+    'Avg. Cadence': 'float64',
+    'Max. Cadence': 'float64',
+    'Strokes': 'float64',
+    'Avg. Temp (°C)': 'float64',
+    'Min. Temp (°C)': 'float64',
+    'Max. Temp (°C)': 'float64',
+    'Avg. Power': 'float64',
+    'Max. Power': 'float64',
+    'Normalized Power': 'float64',
+    'Aerobic Training Effect': 'float64',
+    'Anaerobic Training Effect': 'float64',
+    'Vo2max Value': 'float64',
+    'Start Latitude': 'float64',
+    'Start Longitude': 'float64',
+    'End Latitude': 'float64',
+    'End Longitude': 'float64',
+}
+CSV_DATE_COLUMNS = ['Start Time']
+CSV_CATEGORY_COLUMNS = ['Activity Type']
+CSV_CHUNKSIZE = 1000
+
+
+def _newest_first(entries):
+    return sorted(entries, key=lambda e: (e.export_date is not None, e.export_date, e.export), reverse=True)
+
+
+def iter_activity_chunks(entries, schema=CSV_SCHEMA, chunksize=CSV_CHUNKSIZE):
+    '''
+    Read activities*.csv files in chunks, newest snapshot first, yielding
+    only rows of activities not seen before so memory is bounded by the
+    number of unique activities rather than rows across snapshots; the
+    first row read for an activity wins, within a chunk as across chunks
+
+    Parameters
+    ----------
+    entries: list of SCANhelper.ExportFile
+        activities*.csv files
+    schema: dict (default=CSV_SCHEMA)
+        column -> dtype; columns not in schema are not read
+    chunksize: int (default=CSV_CHUNKSIZE)
+        rows per chunk
+
+    Yields
+    ------
+    pandas.DataFrame
+    '''
+    seen = set()
+    for entry in _newest_first(entries):
+        for chunk in read_csv(
+            entry.path,
+            usecols=lambda col: col in schema,
+            dtype={col: dtype for col, dtype in schema.items() if col not in CSV_DATE_COLUMNS},
+            chunksize=chunksize
+        ):
+            chunk = chunk.drop_duplicates(subset='Activity ID', keep='first')
+            chunk = chunk[~chunk['Activity ID'].isin(seen)]
+            seen.update(chunk['Activity ID'])
+            if not chunk.empty:
+                yield chunk
+
+
+@th.timed('csv.activities')
+def gather_activities_data(export_dir, backup_dir, formats=('pkl',), inventory=None):
     '''
     Return concatenation of activities.csv files in
     subdirectories of export_dir
@@ -16,6 +114,12 @@ def gather_activities_data(export_dir, backup_dir):
     backup_dir: str -> directory
         path to directory hosting data from export_dir
 
+    formats: iterable of str (default=('pkl',))
+        formats ('pkl', 'parquet') activities_reference is written to
+
+    inventory: list of SCANhelper.ExportFile (default=None)
+        shared scan of export_dir; scanned here if None
+
     Returns
     -------
     int
@@ -24,23 +128,28 @@ def gather_activities_data(export_dir, backup_dir):
     Raises
     ------
     AssertionError
-        when csv_data DataFrame cannot be written to .pkl
+        when csv_data DataFrame cannot be written to .pkl/.parquet
     '''
 
-    csv_list = [
-        read_csv(f'{export_dir}/{export}/{file}')
-        for export in os.listdir(export_dir)
-        for file in os.listdir(f'{export_dir}/{export}')
-        if file.startswith('activities') and file.endswith('.csv')
-    ]
-    csv_data = concat(csv_list)\
-        .drop_duplicates(subset='Activity ID', keep='last')\
-        .dropna(axis=1, how='all')\
-        .sort_values('Start Time')\
-        .reset_index(drop=True)
-    csv_data.drop(columns=(csv_data.sum(axis=0) == 0).index[csv_data.sum(axis=0) == 0], inplace=True)
-
-    csv_data.to_pickle(f'{backup_dir}/activities_reference.pkl')
-    assert os.path.isfile(f'{backup_dir}/activities_reference.pkl'), FileNotFoundError
-    
+    if inventory is None:
+        inventory = sh.scan_export_dir(export_dir)
+    csv_data = concat(iter_activity_chunks(sh.select(inventory, kind='csv', prefix='activities')))\
+        .dropna(axis=1, how='all')
+    for col in CSV_DATE_COLUMNS:
+        if col in csv_data:
+            csv_data[col] = to_datetime(csv_data[col])
+    for col in CSV_CATEGORY_COLUMNS:
+        if col in csv_data:
+            csv_data[col] = csv_data[col].astype('category')
+    csv_data = drop_zero_cols(
+        csv_data.sort_values('Start Time').reset_index(drop=True)
+    )
+
+    if 'pkl' in formats:
+        csv_data.to_pickle(f'{backup_dir}/activities_reference.pkl')
+        assert os.path.isfile(f'{backup_dir}/activities_reference.pkl'), FileNotFoundError
+    if 'parquet' in formats:
+        pm.write_summary_parquet(csv_data, f'{backup_dir}/activities_reference.parquet')
+        assert os.path.isfile(f'{backup_dir}/activities_reference.parquet'), FileNotFoundError
+
     return csv_data.shape[0]
@@ -0,0 +1,235 @@
+import os
+import json
+
+import numpy as np
+import pandas as pd
+
+import GPXcleaner as gc
+
+
+# window lengths (seconds) of the mean-maximal curves: 1s ... 5h
+CURVE_DURATIONS = [
+    1, 2, 3, 5, 10, 15, 20, 30, 45,
+    60, 120, 180, 300, 600, 900, 1200, 1800, 2700,
+    3600, 5400, 7200, 10800, 14400, 18000,
+]
+
+# enriched-frame columns with a curve; gaps in power/speed are time spent
+# stopped (zero), gaps in heart rate hold the last reading
+CURVE_CHANNELS = ['power', 'heart_rate', 'speed_kmh']
+ZERO_FILL_CHANNELS = ['power', 'speed_kmh']
+
+# longest activity resampled to 1 Hz (seconds); guards against bad clocks
+MAX_ACTIVITY_S = 48 * 3600
+
+
+def elapsed_seconds(gpx_df):
+    '''
+    Whole seconds since the activity's first point, per trackpoint
+    '''
+    utc_time = gc.get_utc_time(gpx_df)
+    return (utc_time - utc_time.iloc[0]).dt.total_seconds().round().to_numpy()
+
+
+def resample_1hz(gpx_df, column, seconds=None):
+    '''
+    One value per second since the activity's first point
+
+    Parameters
+    ----------
+    gpx_df: pandas.DataFrame
+        frame returned by GPXmanager.raw_gpx_to_reuben_gpx (either schema)
+    column: str
+        one of CURVE_CHANNELS
+    seconds: numpy.ndarray (default=None)
+        returned by elapsed_seconds, computed here if None
+
+    Returns
+    -------
+    numpy.ndarray or None
+        float64 samples; None if the column is missing or empty
+    '''
+    if column not in gpx_df:
+        return None
+    values = gpx_df[column].to_numpy(dtype=np.float64, na_value=np.nan)
+    if np.isnan(values).all():
+        return None
+
+    if seconds is None:
+        seconds = elapsed_seconds(gpx_df)
+    valid = ~np.isnan(seconds) & (seconds >= 0) & (seconds < MAX_ACTIVITY_S)
+    seconds = seconds[valid].astype(np.int64)
+
+    samples = np.full(seconds.max() + 1 if seconds.size else 0, np.nan)
+    samples[seconds] = values[valid]
+    if column in ZERO_FILL_CHANNELS:
+        return np.nan_to_num(samples, nan=0.0)
+    return pd.Series(samples).ffill().bfill().to_numpy()
+
+
+def mean_max(samples, durations=CURVE_DURATIONS):
+    '''
+    Best average over every window length, from one cumulative sum so each
+    duration is a single vectorized difference rather than a rolling mean
+
+    Parameters
+    ----------
+    samples: numpy.ndarray
+        1 Hz samples without NaN
+    durations: list of int (default=CURVE_DURATIONS)
+        window lengths in seconds
+
+    Returns
+    -------
+    numpy.ndarray
+        best mean per duration; NaN where the activity is shorter
+    '''
+    cumsum = np.concatenate([[0.0], np.cumsum(samples)])
+    best = np.full(len(durations), np.nan)
+    for i, window in enumerate(durations):
+        if window <= samples.size:
+            best[i] = (cumsum[window:] - cumsum[:-window]).max() / window
+    return best
+
+
+def activity_curves(gpx_df, durations=CURVE_DURATIONS):
+    '''
+    Mean-maximal curves of one activity
+
+    Returns
+    -------
+    pandas.DataFrame
+        index: duration_s
+        cols: CURVE_CHANNELS (NaN for channels the activity lacks)
+    '''
+    curves_df = pd.DataFrame(index=pd.Index(durations, name='duration_s'))
+    seconds = elapsed_seconds(gpx_df)
+    for channel in CURVE_CHANNELS:
+        samples = resample_1hz(gpx_df, channel, seconds=seconds)
+        curves_df[channel] = np.nan if samples is None else mean_max(samples, durations)
+    return curves_df
+
+
+def write_activity_curves(gpx_df, file_path):
+    '''
+    Write an activity's curves (GPXmanager.WRITERS['curves']) as .json
+
+    Parameters
+    ----------
+    gpx_df: pandas.DataFrame
+        frame returned by GPXmanager.raw_gpx_to_reuben_gpx
+    file_path: str
+        typically <backup_dir>/<type>/<id>.curves
+    '''
+    curves_df = activity_curves(gpx_df)
+    with open(file_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'activity_id': str(gc.get_activity_id(gpx_df)),
+            'start_time': gc.get_utc_time(gpx_df).iloc[0].isoformat(),
+            'duration_s': curves_df.index.tolist(),
+            **{
+                channel: [None if np.isnan(v) else round(float(v), 3) for v in curves_df[channel]]
+                for channel in curves_df.columns
+            },
+        }, f)
+
+
+def read_activity_curves(file_path):
+    '''
+    Read curves written by write_activity_curves
+
+    Returns
+    -------
+    pandas.DataFrame
+        cols: activity_id, start_time, duration_s, CURVE_CHANNELS
+    '''
+    with open(file_path, encoding='utf-8') as f:
+        cached = json.load(f)
+    curves_df = pd.DataFrame({
+        'duration_s': cached['duration_s'],
+        **{channel: cached.get(channel) for channel in CURVE_CHANNELS},
+    }).astype({channel: 'float64' for channel in CURVE_CHANNELS})
+    curves_df.insert(0, 'start_time', pd.Timestamp(cached['start_time']))
+    curves_df.insert(0, 'activity_id', cached['activity_id'])
+    return curves_df
+
+
+def load_curves(backup_dir, activity_index, activity_types=None):
+    '''
+    Cached curves of every backed-up activity, without loading any points
+
+    Parameters
+    ----------
+    backup_dir: str
+        path to backup directory
+    activity_index: dict
+        activity ID -> backup directory, see JSONmanager.load_activity_index
+    activity_types: list of str (default=None)
+        backup directories to include (e.g. ['Cycling']); all if None
+
+    Returns
+    -------
+    pandas.DataFrame
+        one row per activity and duration, see read_activity_curves
+    '''
+    curve_files = [
+        f'{backup_dir}/{activity_dir}/{activity_id}.curves'
+        for activity_id, activity_dir in activity_index.items()
+        if activity_types is None or activity_dir in activity_types
+    ]
+    curves = [read_activity_curves(path) for path in curve_files if os.path.isfile(path)]
+    if not curves:
+        return pd.DataFrame(columns=['activity_id', 'start_time', 'duration_s', *CURVE_CHANNELS])
+    return pd.concat(curves, ignore_index=True)
+
+
+def best_curves(curves_df, start=None, end=None):
+    '''
+    Best-ever curve per channel over activities starting in [start, end)
+
+    Parameters
+    ----------
+    curves_df: pandas.DataFrame
+        returned by load_curves
+    start, end: str or pandas.Timestamp (default=None)
+        bounds on activity start time (UTC)
+
+    Returns
+    -------
+    pandas.DataFrame
+        index: duration_s
+        cols: per channel the best value and `<channel>_activity_id`
+    '''
+    if start is not None:
+        curves_df = curves_df[curves_df['start_time'] >= pd.Timestamp(start, tz='UTC')]
+    if end is not None:
+        curves_df = curves_df[curves_df['start_time'] < pd.Timestamp(end, tz='UTC')]
+
+    best_df = pd.DataFrame(index=pd.Index(sorted(curves_df['duration_s'].unique()), name='duration_s'))
+    for channel in CURVE_CHANNELS:
+        channel_df = curves_df.dropna(subset=[channel])
+        best = channel_df.loc[channel_df.groupby('duration_s')[channel].idxmax()].set_index('duration_s')
+        best_df[channel] = best[channel]
+        best_df[f'{channel}_activity_id'] = best['activity_id']
+    return best_df
+
+
+def season_curves(curves_df, freq='Y'):
+    '''
+    Best curve per channel for every period (season) of activity start times
+
+    Parameters
+    ----------
+    curves_df: pandas.DataFrame
+        returned by load_curves
+    freq: str (default='Y')
+        pandas period frequency, e.g. 'Y' per year, 'Q' per quarter
+
+    Returns
+    -------
+    pandas.DataFrame
+        index: (season, duration_s)
+        cols: CURVE_CHANNELS
+    '''
+    seasons = curves_df['start_time'].dt.tz_convert(None).dt.to_period(freq).rename('season')
+    return curves_df.groupby([seasons, 'duration_s'])[CURVE_CHANNELS].max()
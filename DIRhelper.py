@@ -1,12 +1,129 @@
 import os
+import json
 
 from pandas.core.frame import DataFrame
 
 import rich
 from rich.table import Table
 
+import FILEhelper as fh
 
-def get_dir_info(dir):
+
+# per-directory aggregates cached in the root of each scanned directory
+DIR_STATS_FILE = '.dir_stats.json'
+
+# file kinds always shown, even when a directory holds none of them
+DEFAULT_KINDS = ['gpx', 'json', 'pkl']
+
+# row of files directly in the scanned directory (e.g. activities.sqlite)
+ROOT_ROW = '.'
+
+
+def _file_kind(name):
+    return os.path.splitext(name)[1][1:].lower() or 'other'
+
+
+def scan_files(path):
+    '''
+    Count files and bytes per file kind (extension) directly in path,
+    ignoring hidden files
+
+    Returns
+    -------
+    dict
+        keys: file kind
+        vals: dict(files=int, bytes=int)
+    '''
+    stats = {}
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.name.startswith('.') or not entry.is_file():
+                continue
+            kind_stats = stats.setdefault(_file_kind(entry.name), {'files': 0, 'bytes': 0})
+            kind_stats['files'] += 1
+            kind_stats['bytes'] += entry.stat().st_size
+    return stats
+
+
+def load_dir_stats(dir):
+    try:
+        with open(f'{dir}/{DIR_STATS_FILE}', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def save_dir_stats(dir, cache):
+    try:
+        with fh.atomic_path(f'{dir}/{DIR_STATS_FILE}') as tmp_path:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(cache, f)
+    except OSError:
+        # read-only directories are shown without caching
+        pass
+
+
+def get_dir_stats(dir, use_cache=True):
+    '''
+    Files and bytes per file kind for every subdirectory of dir, re-scanning
+    only subdirectories whose mtime changed since the cached scan
+
+    A directory's mtime changes when entries are added, removed or renamed
+    into it (as the backup writers do), not when a file is rewritten in
+    place, which the cache does not notice
+
+    Parameters
+    ----------
+    dir: str
+        path to directory
+    use_cache: bool (default=True)
+        read and update DIR_STATS_FILE in dir
+
+    Returns
+    -------
+    dict
+        keys: subdirectory (ROOT_ROW for files directly in dir)
+        vals: dict returned by scan_files
+    '''
+    cache = load_dir_stats(dir) if use_cache else {}
+    with os.scandir(dir) as entries:
+        subdirs = sorted(
+            (e for e in entries if e.is_dir() and not e.name.startswith('.')),
+            key=lambda e: e.name
+        )
+
+    stats, updated = {}, {}
+    for subdir in subdirs:
+        # mtime is read before scanning, so changes during the scan are
+        # picked up next time
+        mtime_ns = subdir.stat().st_mtime_ns
+        cached = cache.get(subdir.name)
+        if cached is not None and cached['mtime_ns'] == mtime_ns:
+            stats[subdir.name] = cached['stats']
+        else:
+            stats[subdir.name] = scan_files(subdir.path)
+        updated[subdir.name] = {'mtime_ns': mtime_ns, 'stats': stats[subdir.name]}
+
+    # few files live in the root and writing the cache changes its mtime,
+    # so the root is always scanned
+    root_stats = scan_files(dir)
+    if root_stats:
+        stats[ROOT_ROW] = root_stats
+
+    if use_cache and updated != cache:
+        save_dir_stats(dir, updated)
+    return stats
+
+
+def _stats_to_row(stats):
+    row = {}
+    for kind, kind_stats in stats.items():
+        row[f'{kind}_files'] = kind_stats['files']
+        row[f'{kind}_bytes'] = kind_stats['bytes']
+    return row
+
+
+def get_dir_info(dir, inventory=None, use_cache=True):
     '''
     Gathers file information per subdirectory of passed directory (dir)
     to be passed to dir_info_to_dir_df
@@ -15,43 +132,44 @@ def get_dir_info(dir):
     ----------
     dir: str
         path to directory
+    inventory: list of SCANhelper.ExportFile (default=None)
+        existing scan of dir (export directories only); avoids listing
+        and stat-ing every file again
+    use_cache: bool (default=True)
+        passed to get_dir_stats
 
     Returns
     -------
     dict
         keys: directory (or `empty`)
         vals: dict
-            keys: file type/size
-            vals: statistic
+            keys: <kind>_files/<kind>_bytes for every file kind present
+            vals: int
     '''
-    if (len([d for d in os.listdir(dir) if not os.path.isdir(f'{dir}/{d}')]) == len(os.listdir(dir))):
-        return {dir : {'empty' : {
-            'gpx_files':0, 'gpx_MB':0,
-            'json_files':0, 'json_MB':0,
-            'pkl_files':0, 'pkl_MB':0}}}
-    
-    # keep in case merge both dictionaries
-    retr_dict = {dir: {}}
-    for subdir in sorted(os.listdir(dir)):
-        
-        if (subdir == '.DS_Store') or (subdir.endswith('.pkl')) or (subdir.endswith('.json') or (subdir.endswith('.csv')) or (subdir.endswith('.gpx'))):
-            continue
-        
-        retr_dict[dir][subdir] = {
-            'gpx_files':0, 'gpx_MB':0,
-            'json_files':0, 'json_MB':0,
-            'pkl_files':0, 'pkl_MB':0}
-        filtered_subdir = [
-            f
-            for f in os.listdir(f'{dir}/{subdir}')
-            if f.endswith('.gpx') or f.endswith('.json') or f.endswith('.pkl')]
-        
-        for file in filtered_subdir:
-            file_extension = file[file.rfind('.') + 1 : ]
-            retr_dict[dir][subdir][f'{file_extension}_files'] += 1
-            retr_dict[dir][subdir][f'{file_extension}_MB'] += round(os.path.getsize(f'{dir}/{subdir}/{file}') / 100000, 2)
-    
-    return retr_dict
+    if inventory is not None:
+        return inventory_to_dir_info(dir, inventory)
+
+    dir_stats = get_dir_stats(dir, use_cache=use_cache)
+    if not dir_stats:
+        return {dir : {'empty' : {}}}
+    return {dir: {subdir: _stats_to_row(stats) for subdir, stats in dir_stats.items()}}
+
+
+def inventory_to_dir_info(dir, inventory):
+    '''
+    Same statistics as get_dir_info, computed from a SCANhelper inventory
+    '''
+    if not inventory:
+        return {dir : {'empty' : {}}}
+
+    dir_stats = {}
+    for entry in inventory:
+        kind_stats = dir_stats.setdefault(entry.export, {})\
+            .setdefault(entry.kind or 'other', {'files': 0, 'bytes': 0})
+        kind_stats['files'] += 1
+        kind_stats['bytes'] += entry.size
+
+    return {dir: {export: _stats_to_row(stats) for export, stats in dir_stats.items()}}
 
 
 def dir_info_to_dir_df(dir_info):
@@ -70,17 +188,28 @@ def dir_info_to_dir_df(dir_info):
     -------
     pandas.DataFrame
         rows: directories
-        cols: file sizes/types
+        cols: <kind>_files, <kind>_bytes per file kind (exact integers)
     '''
 
-    dir_idxs = list(dir_info.values())[0].keys()
-    dir_vals = list(list(dir_info.values())[0].values())
-    dir_df = DataFrame(dir_vals, index=dir_idxs)
+    dir_rows = list(dir_info.values())[0]
+    dir_df = DataFrame(list(dir_rows.values()), index=list(dir_rows.keys()))
+    kinds = sorted(
+        set(DEFAULT_KINDS) | {col[:col.rfind('_')] for col in dir_df.columns},
+        key=lambda kind: (kind not in DEFAULT_KINDS, kind)
+    )
+    dir_df = dir_df.reindex(
+        columns=[f'{kind}_{stat}' for kind in kinds for stat in ['files', 'bytes']]
+    ).fillna(0).astype('int64')
     dir_df.loc["TOTAL"] = dir_df.sum()
     return dir_df
 
 
-def print_dir_df(param, dir):
+def _format_stat(col, val):
+    # bytes are summed exactly and converted to MB once, for display
+    return f'{val / 1e6:.2f}' if col.endswith('_bytes') else str(val)
+
+
+def print_dir_df(param, dir, inventory=None):
     '''
     Gather and display directory statistics to terminal
 
@@ -90,6 +219,8 @@ def print_dir_df(param, dir):
         title of directory to be displayed in terminal (e.g. 'backup_directory')
     dir: str
         path to directory
+    inventory: list of SCANhelper.ExportFile (default=None)
+        passed to get_dir_info
 
     Returns
     -------
@@ -97,7 +228,7 @@ def print_dir_df(param, dir):
         rich.Table printed to terminal
     '''
 
-    dir_df = dir_info_to_dir_df(get_dir_info(dir))
+    dir_df = dir_info_to_dir_df(get_dir_info(dir, inventory=inventory))
     table = Table(
         title=f'{param.upper()} [{dir}]',
         style='bold magenta'
@@ -109,18 +240,18 @@ def print_dir_df(param, dir):
     )
     for col in dir_df.columns:
         table.add_column(
-            col.title(),
+            col.replace('_bytes', '_MB').title(),
             justify='left',
             style='cyan'
         )
     for i in range(dir_df.shape[0]):
         d1 = dir_df.index[i]
-        table.add_row(d1, *tuple([str(elem) for elem in dir_df.iloc[i, :]]))
+        table.add_row(d1, *tuple([_format_stat(col, elem) for col, elem in dir_df.iloc[i, :].items()]))
     
     rich.print(table)
 
 
-def directory_status(**kwargs):
+def directory_status(inventory=None, **kwargs):
     '''
     Caller function for DIRhelper functions
 
@@ -129,36 +260,25 @@ def directory_status(**kwargs):
     *kwargs: tuple(kwarg=val, ... )
         kwarg -> title of table displaying directory information
         val   -> str: path to directory
+    inventory: list of SCANhelper.ExportFile (default=None)
+        existing scan of the (export) directory passed in kwargs
     
     Example
     -------
     >>> directory_status(backup_dir='../backup-garmin-connect')
-                                BACKUP_DIRECTORY [../backup-garmin-connect]                         
-    ┏━━━━━━━━━━━━━━┳━━━━━━━━━━━┳━━━━━━━━┳━━━━━━━━━━━━┳━━━━━━━━━┳━━━━━━━━━━━┳━━━━━━━━━━━━━━━━━━━━┓
-    ┃    Directory ┃ Gpx_Files ┃ Gpx_Mb ┃ Json_Files ┃ Json_Mb ┃ Pkl_Files ┃ Pkl_Mb             ┃
-    ┡━━━━━━━━━━━━━━╇━━━━━━━━━━━╇━━━━━━━━╇━━━━━━━━━━━━╇━━━━━━━━━╇━━━━━━━━━━━╇━━━━━━━━━━━━━━━━━━━━┩
-    │       Cardio │ 0.0       │ 0.0    │ 1.0        │ 0.0     │ 0.0       │ 0.0                │
-    │      Cycling │ 0.0       │ 0.0    │ 1.0        │ 0.03    │ 160.0     │ 193.21             │
-    │         Golf │ 0.0       │ 0.0    │ 1.0        │ 0.0     │ 3.0       │ 6.98               │
-    │  Road_Biking │ 0.0       │ 0.0    │ 1.0        │ 0.01    │ 53.0      │ 84.73999999999998  │
-    │       Rowing │ 0.0       │ 0.0    │ 1.0        │ 0.01    │ 54.0      │ 66.05000000000001  │
-    │      Running │ 0.0       │ 0.0    │ 1.0        │ 0.01    │ 70.0      │ 50.96              │
-    │ Virtual_Ride │ 0.0       │ 0.0    │ 1.0        │ 0.0     │ 14.0      │ 38.43              │
-    │      Walking │ 0.0       │ 0.0    │ 1.0        │ 0.0     │ 15.0      │ 25.619999999999994 │
-    │        TOTAL │ 0.0       │ 0.0    │ 8.0        │ 0.06    │ 369.0     │ 465.99             │
-    └──────────────┴───────────┴────────┴────────────┴─────────┴───────────┴────────────────────┘
-    
-    >>> directory_status(export_directory='../export-garmin-connect')
-
-                                            EXPORT_DIRECTORY [../export-garmin-connect]                                           
-    ┏━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━┳━━━━━━━━━━━┳━━━━━━━━━━━━━━━━━━━━┳━━━━━━━━━━━━┳━━━━━━━━━━━━━━━━━━━━┳━━━━━━━━━━━┳━━━━━━━━┓
-    ┃                            Directory ┃ Gpx_Files ┃ Gpx_Mb             ┃ Json_Files ┃ Json_Mb            ┃ Pkl_Files ┃ Pkl_Mb ┃
-    ┡━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━╇━━━━━━━━━━━╇━━━━━━━━━━━━━━━━━━━━╇━━━━━━━━━━━━╇━━━━━━━━━━━━━━━━━━━━╇━━━━━━━━━━━╇━━━━━━━━┩
-    │ 2023-01-02_garmin_connect_export_fit │ 0.0       │ 0.0                │ 14.0       │ 22.849999999999998 │ 0.0       │ 0.0    │
-    │ 2023-01-02_garmin_connect_export_gpx │ 413.0     │ 1395.0300000000007 │ 14.0       │ 22.849999999999998 │ 0.0       │ 0.0    │
-    │                                TOTAL │ 413.0     │ 1395.0300000000007 │ 28.0       │ 45.699999999999996 │ 0.0       │ 0.0    │
-    └──────────────────────────────────────┴───────────┴────────────────────┴────────────┴────────────────────┴───────────┴────────┘
+                                  BACKUP_DIR [../backup-garmin-connect]
+    ┏━━━━━━━━━━━━━━┳━━━━━━━━━━━┳━━━━━━━━┳━━━━━━━━━━━━┳━━━━━━━━━┳━━━━━━━━━━━┳━━━━━━━━┳━━━━━━━━━━━┳━━━━━━━━┓
+    ┃    Directory ┃ Gpx_Files ┃ Gpx_Mb ┃ Json_Files ┃ Json_Mb ┃ Pkl_Files ┃ Pkl_Mb ┃ Csv_Files ┃ Csv_Mb ┃
+    ┡━━━━━━━━━━━━━━╇━━━━━━━━━━━╇━━━━━━━━╇━━━━━━━━━━━━╇━━━━━━━━━╇━━━━━━━━━━━╇━━━━━━━━╇━━━━━━━━━━━╇━━━━━━━━┩
+    │      Cycling │ 0         │ 0.00   │ 1          │ 0.00    │ 160       │ 19.32  │ 160       │ 41.87  │
+    │      Running │ 0         │ 0.00   │ 1          │ 0.00    │ 70        │ 5.10   │ 70        │ 11.05  │
+    │            . │ 0         │ 0.00   │ 3          │ 0.01    │ 2         │ 1.21   │ 0         │ 0.00   │
+    │        TOTAL │ 0         │ 0.00   │ 5          │ 0.01    │ 232       │ 25.63  │ 230       │ 52.92  │
+    └──────────────┴───────────┴────────┴────────────┴─────────┴───────────┴────────┴───────────┴────────┘
+
+    one Files/MB pair per file kind present (parquet, sqlite, ...); `.` holds
+    files directly in the directory; sizes are exact bytes shown in MB
     '''
 
     for param, dir in kwargs.items():
-        print_dir_df(param, dir)
+        print_dir_df(param, dir, inventory=inventory)
@@ -0,0 +1,95 @@
+import os
+import sys
+import shutil
+import subprocess
+from datetime import date
+
+
+DEFAULT_GCEXPORT_DIR = '../garmin-connect-export'
+
+
+def export_name(day=None):
+    '''
+    Name gcexport gives an export made on `day` (default: today), e.g.
+    2023-01-02_garmin_connect_export; snapshots get a _gpx/_fit suffix
+    '''
+    return f"{(day or date.today()).strftime('%Y-%m-%d')}_garmin_connect_export"
+
+
+def download_gcexport(export_dir, source_dir=None, username=None, password=None, count='all', **kwargs):
+    '''
+    Download today's GPX and original FIT exports with gcexport.py, unless
+    export_dir already holds them
+
+    Parameters
+    ----------
+    export_dir: str
+        path to export directory
+    source_dir: str (default=None)
+        path to garmin-connect-export checkout; DEFAULT_GCEXPORT_DIR if None
+    username, password: str (default=None)
+        Garmin Connect credentials
+    count: str (default='all')
+        number of activities to download
+
+    Returns
+    -------
+    list of str
+        snapshot directories added to export_dir
+    '''
+    source_dir = source_dir or DEFAULT_GCEXPORT_DIR
+    name = export_name()
+
+    added = []
+    for kind, options in [('gpx', []), ('fit', ['-f=original', '--unzip'])]:
+        snapshot = f'{name}_{kind}'
+        if os.path.isdir(f'{export_dir}/{snapshot}'):
+            continue
+        # run inside the gcexport checkout instead of changing this
+        # process's working directory
+        subprocess.run(
+            [sys.executable, 'gcexport.py', f'--username={username}', f'--password={password}', f'-c={count}', *options],
+            cwd=source_dir, check=True
+        )
+        shutil.move(f'{source_dir}/{name}', f'{export_dir}/{snapshot}')
+        added.append(snapshot)
+    return added
+
+
+def download_local(export_dir, source_dir=None, **kwargs):
+    '''
+    Copy export snapshots from a local directory (e.g. an earlier gcexport
+    run or synthetic test data) that export_dir does not hold yet; stands
+    in for download_gcexport without network access
+
+    Parameters
+    ----------
+    export_dir: str
+        path to export directory
+    source_dir: str
+        directory of YYYY-MM-DD_garmin_connect_export_<kind> snapshots
+    **kwargs
+        options of other sources (credentials, ...), ignored
+
+    Returns
+    -------
+    list of str
+        snapshot directories added to export_dir
+    '''
+    assert source_dir is not None and os.path.isdir(source_dir), f'{source_dir} is not a directory'
+
+    added = []
+    with os.scandir(source_dir) as snapshots:
+        for snapshot in sorted((s for s in snapshots if s.is_dir()), key=lambda s: s.name):
+            if not os.path.isdir(f'{export_dir}/{snapshot.name}'):
+                shutil.copytree(snapshot.path, f'{export_dir}/{snapshot.name}')
+                added.append(snapshot.name)
+    return added
+
+
+# download adapters keyed by --source; each is called as
+# adapter(export_dir, source_dir=..., username=..., password=..., count=...)
+SOURCES = {
+    'gcexport': download_gcexport,
+    'local': download_local,
+}
@@ -0,0 +1,96 @@
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import GPXmanager as gm
+import TIMEhelper as th
+
+
+def _process(gpx_path, timezone=None, compact=False):
+    with th.activity(gm.activity_id_from_path(gpx_path)):
+        try:
+            return gpx_path, gm.raw_gpx_to_reuben_gpx(gpx_path, timezone=timezone, compact=compact), None
+        except Exception as e:
+            # exceptions are returned as text since not all of them pickle
+            # across process boundaries
+            return gpx_path, None, f'{type(e).__name__}: {e}'
+
+
+def process_activity(gpx_path, timezone=None, compact=False):
+    '''
+    Build the enriched frame for a single activity in a worker process,
+    isolating any failure so that one bad file does not abort the export
+
+    Parameters
+    ----------
+    gpx_path: str
+        path to .gpx file
+    timezone: str (default=None)
+        passed to GPXmanager.raw_gpx_to_reuben_gpx
+    compact: bool (default=False)
+        passed to GPXmanager.raw_gpx_to_reuben_gpx
+
+    Returns
+    -------
+    tuple(str, pandas.DataFrame or None, str or None, list of TIMEhelper.Timing)
+        gpx_path, enriched frame (None on failure), error message (None on
+        success) and the stage timings recorded while processing
+    '''
+    # timings are shipped back with the result since worker processes do
+    # not share the parent's TIMEhelper records; a worker process has no
+    # writer threads recording alongside it
+    start = th.mark()
+    result = _process(gpx_path, timezone=timezone, compact=compact)
+    return (*result, th.drain(start))
+
+
+def _collect(result):
+    gpx_path, gpx_df, error, timings = result
+    th.merge(timings)
+    return gpx_path, gpx_df, error
+
+
+def iter_processed(gpx_files, workers=1, timezone=None, compact=False):
+    '''
+    Process activities serially or on a pool of worker processes, yielding
+    results as they complete so the caller can drive progress and writers
+
+    Parameters
+    ----------
+    gpx_files: iterable of str
+        paths to .gpx files
+    workers: int (default=1)
+        number of worker processes; 1 processes in the calling process
+    timezone: str (default=None)
+        passed to process_activity
+    compact: bool (default=False)
+        passed to process_activity
+
+    Yields
+    ------
+    tuple(str, pandas.DataFrame or None, str or None)
+        see process_activity; stage timings are merged into this process's
+        TIMEhelper records
+    '''
+    if workers <= 1:
+        # timings are recorded straight into this process's records, which
+        # writer threads append to concurrently
+        yield from map(partial(_process, timezone=timezone, compact=compact), gpx_files)
+        return
+
+    process = partial(process_activity, timezone=timezone, compact=compact)
+
+    gpx_files = iter(gpx_files)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # keep a bounded number of activities in flight so finished frames
+        # do not pile up in memory ahead of the writers
+        pending = set()
+        for gpx_path in gpx_files:
+            pending.add(executor.submit(process, gpx_path))
+            if len(pending) >= 2 * workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield _collect(future.result())
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield _collect(future.result())
@@ -0,0 +1,24 @@
+import os
+from contextlib import contextmanager
+
+
+@contextmanager
+def atomic_path(file_path):
+    '''
+    Temporary path next to file_path, renamed into place when the block
+    completes, so an interrupted write never leaves a truncated file behind;
+    on error the temporary file is removed and file_path left untouched
+
+    Example
+    -------
+    >>> with atomic_path(manifest_path) as tmp_path:
+    ...     with open(tmp_path, 'w', encoding='utf-8') as f:
+    ...         json.dump(manifest, f)
+    '''
+    tmp_path = f'{file_path}.tmp'
+    try:
+        yield tmp_path
+        os.replace(tmp_path, file_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
@@ -1,23 +1,133 @@
-import pandas as pd
+import os
+
 import numpy as np
+import pandas as pd
 import fitparse
 
+import TIMEhelper as th
+
+
+# record fields that can be decoded and the dtype of their returned arrays
+FIT_FIELDS = {
+    'timestamp': 'datetime64[ns]',
+    'power': np.float64,
+    'temperature': np.float64,
+    'left_right_balance': np.float64,
+}
+
+
+def fit_path_from_gpx(gpx_path):
+    '''
+    Locate the .fit file exported alongside a .gpx file, i.e.
+    <date>_garmin_connect_export_gpx/activity_<id>.gpx ->
+    <date>_garmin_connect_export_fit/activity_<id>.fit
+
+    Parameters
+    ----------
+    gpx_path: str
+        path to .gpx file
+
+    Returns
+    -------
+    str
+        path to .fit file
+    '''
+    export_dir, gpx_file = os.path.split(gpx_path)
+    if export_dir.endswith('_gpx'):
+        export_dir = export_dir[:-len('_gpx')] + '_fit'
+    return os.path.join(export_dir, os.path.splitext(gpx_file)[0] + '.fit')
+
+
+@th.timed('fit.decode', points=lambda fit_data: len(next(iter(fit_data.values()), [])))
+def read_fit_fields(fit_path, fields=('timestamp', 'power')):
+    '''
+    Decode selected fields of every `record` message in a .fit file
+
+    Parameters
+    ----------
+    fit_path: str
+        path to .fit file
+    fields: iterable of str (default=('timestamp', 'power'))
+        keys of FIT_FIELDS to decode
+
+    Returns
+    -------
+    dict
+        keys: field names
+        vals: numpy.ndarray, one element per record (NaN/NaT where missing)
+    '''
+    fields = list(fields)
+    unknown = set(fields) - set(FIT_FIELDS)
+    if unknown:
+        raise ValueError(f'Unsupported FIT fields: {sorted(unknown)}')
+
+    columns = {field: [] for field in fields}
+    # wanted fields declared by each definition message; messages whose
+    # definition lacks a field are never searched for it
+    present_by_def = {}
+    for record in fitparse.FitFile(fit_path).get_messages('record'):
+        present = present_by_def.get(record.def_mesg)
+        if present is None:
+            declared = {field_def.name for field_def in record.def_mesg.field_defs}
+            # compressed-timestamp headers add timestamp outside the definition
+            declared.add('timestamp')
+            present = present_by_def[record.def_mesg] = declared.intersection(fields)
+
+        values = {
+            data.name: data.value
+            for data in record.fields
+            if data.name in present
+        }
+        for field in fields:
+            columns[field].append(values.get(field))
+
+    return {
+        field: _to_array(values, FIT_FIELDS[field])
+        for field, values in columns.items()
+    }
+
+
+def _to_array(values, dtype):
+    if dtype == 'datetime64[ns]':
+        return np.array(values, dtype=dtype)
+    return np.array([np.nan if v is None else v for v in values], dtype=dtype)
+
+
+@th.timed('fit.align', points=len)
+def align_fit_fields(times, fit_data, tolerance='1s'):
+    '''
+    Align decoded FIT channels onto arbitrary timestamps with a nearest
+    timestamp match, independent of how many records either side has
+
+    Parameters
+    ----------
+    times: pandas.Series
+        UTC timestamps to align onto (e.g. GPX trackpoint times)
+    fit_data: dict
+        returned by read_fit_fields; must contain `timestamp`
+    tolerance: str or pandas.Timedelta (default='1s')
+        maximum distance between matched timestamps
+
+    Returns
+    -------
+    pandas.DataFrame
+        one column per FIT channel, indexed like times (NaN where unmatched)
+    '''
+    channels = [field for field in fit_data if field != 'timestamp']
+
+    fit_df = pd.DataFrame(fit_data)
+    fit_df['timestamp'] = fit_df['timestamp'].dt.tz_localize('UTC')
+    fit_df = fit_df.dropna(subset=['timestamp']).sort_values('timestamp')
 
+    left = pd.DataFrame({'timestamp': pd.to_datetime(times, utc=True), '_order': np.arange(len(times))})
+    merged = pd.merge_asof(
+        left.dropna(subset=['timestamp']).sort_values('timestamp'),
+        fit_df,
+        on='timestamp',
+        direction='nearest',
+        tolerance=pd.Timedelta(tolerance)
+    )
 
-def return_power_data(gpx_path, n):
-    fit_path = gpx_path.replace('gpx', 'fit')
-    fitfile = fitparse.FitFile(fit_path)
-    
-    data_dict = {}
-    for record in fitfile.get_messages('record'):
-        for data in record:
-            if data.name not in data_dict:
-                data_dict[data.name] = []
-            if (data.name in ['distance', 'speed']) and (data.value == None):
-                continue
-            data_dict[data.name].append(data.value)
-    
-    if 'power' in data_dict.keys():
-        return pd.DataFrame(data_dict)['power']
-
-    return [np.nan] * n
+    aligned = merged.set_index('_order')[channels].reindex(np.arange(len(times)))
+    aligned.index = times.index
+    return aligned
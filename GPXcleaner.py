@@ -1,27 +1,100 @@
+import xml.etree.ElementTree as ET
+from functools import lru_cache
+
+import numpy as np
 import pandas as pd
-from datetime import datetime
-import gpxpy
-import pytz
-from haversine import haversine, Unit
+
+import TIMEhelper as th
+
+
+# mean earth radius (meters), matching haversine.Unit.METERS
+EARTH_RADIUS_M = 6371008.8
+
+# TrackPointExtension tag -> column name
+GPX_EXTENSION_FIELDS = {
+    'hr': 'heart_rate',
+    'cad': 'cadence',
+    'atemp': 'temperature',
+    'power': 'power',
+}
+GPX_COLUMNS = ['latitude', 'longitude', 'elevation', 'time', *GPX_EXTENSION_FIELDS.values()]
+
+# used when no timezone is passed and none can be inferred from coordinates
+DEFAULT_TIMEZONE = 'America/Chicago'
+
+
+def _local_name(tag):
+    return tag[tag.rfind('}') + 1:]
+
+
+def _grow(arrays, size):
+    return {
+        col: np.concatenate([arr, np.full(size - len(arr), np.nan, dtype=arr.dtype)])
+        if arr.dtype != object
+        else np.concatenate([arr, np.empty(size - len(arr), dtype=object)])
+        for col, arr in arrays.items()
+    }
 
 
-def read_gpx_file(file_path):
+def read_gpx_file(file_path, chunk_size=4096):
     '''
-    Read in and parse .gpx file
+    Stream trackpoints of .gpx file into column arrays, clearing parsed
+    elements as it goes so memory stays flat for long activities
 
     Parameters
     ----------
     file_path: str
         path to .gpx file
+    chunk_size: int (default=4096)
+        initial capacity of column arrays (doubled when exceeded)
     
     Returns
     -------
-    GPX.Parse object
+    dict
+        keys: column names (see GPX_COLUMNS)
+        vals: numpy.ndarray of length equal to number of trackpoints
     '''
-    gpx_file = open(file_path)
-    return gpxpy.parse(gpx_file)
+    arrays = {col: np.full(chunk_size, np.nan) for col in GPX_COLUMNS if col != 'time'}
+    arrays['time'] = np.empty(chunk_size, dtype=object)
+    
+    n = 0
+    segment = None
+    for event, elem in ET.iterparse(file_path, events=('start', 'end')):
+        tag = _local_name(elem.tag)
+        if event == 'start':
+            if tag == 'trkseg':
+                segment = elem
+            continue
+        if tag != 'trkpt':
+            continue
+        
+        if n == len(arrays['time']):
+            arrays = _grow(arrays, 2 * n)
+        
+        arrays['latitude'][n] = float(elem.get('lat'))
+        arrays['longitude'][n] = float(elem.get('lon'))
+        for child in elem:
+            child_tag = _local_name(child.tag)
+            if child_tag == 'ele' and child.text:
+                arrays['elevation'][n] = float(child.text)
+            elif child_tag == 'time':
+                arrays['time'][n] = child.text
+            elif child_tag == 'extensions':
+                # resolve TrackPointExtension fields by tag, not position
+                for field in child.iter():
+                    col = GPX_EXTENSION_FIELDS.get(_local_name(field.tag))
+                    if col is not None and field.text:
+                        arrays[col][n] = float(field.text)
+        n += 1
+        
+        elem.clear()
+        if segment is not None:
+            segment.remove(elem)
+    
+    return {col: arr[:n] for col, arr in arrays.items()}
 
 
+@th.timed('gpx.parse', points=len)
 def gpx_to_dataframe(file_path):
     '''
     Extract meaningful data related to recorded points per segment per track
@@ -38,19 +111,10 @@ def gpx_to_dataframe(file_path):
         containing data described above
     '''
 
-    points_skeleton = [
-        [point.latitude, point.longitude, point.elevation, point.time,
-        float(point.extensions[0].getchildren()[0].text),
-        float(point.extensions[0].getchildren()[1].text),]
-        for track in read_gpx_file(file_path).tracks
-        for segment in track.segments
-        for point in segment.points
-    ]
+    gpx_arrays = read_gpx_file(file_path)
+    gpx_arrays['time'] = pd.to_datetime(gpx_arrays['time'], utc=True)
 
-    points_df =  pd.DataFrame(
-        points_skeleton,
-        columns=['latitude', 'longitude', 'elevation', 'time', 'heart_rate', 'cadence']
-    ).fillna(method='ffill')
+    points_df = pd.DataFrame(gpx_arrays, columns=GPX_COLUMNS).ffill()
 
     return points_df
 
@@ -63,6 +127,41 @@ def convert_time(time_col):
     return time_col.dt.time
 
 
+def get_utc_time(points_df):
+    '''
+    UTC timestamps of an enriched frame, recombining the separate `date`
+    and `time` (datetime.time) columns when present
+    '''
+    if 'date' in points_df and points_df['time'].dtype == object:
+        return (
+            points_df['date'] + pd.to_timedelta(points_df['time'].astype(str))
+        ).dt.tz_localize('UTC')
+    return pd.to_datetime(points_df['time'], utc=True)
+
+
+def get_activity_id(points_df):
+    '''
+    Activity ID of an enriched frame, stored as a column or, for compact
+    frames, in `attrs`
+    '''
+    if 'activity_id' in points_df:
+        return points_df['activity_id'].iloc[0]
+    return points_df.attrs['activity_id']
+
+
+def with_activity_id(points_df):
+    '''
+    Enriched frame with the activity ID as its first column; compact frames
+    keep it in `attrs`, which only pickle persists, so writers of other
+    formats restore the column
+    '''
+    if 'activity_id' in points_df:
+        return points_df
+    id_df = points_df.copy()
+    id_df.insert(0, 'activity_id', points_df.attrs['activity_id'])
+    return id_df
+
+
 def get_elevation_diff(elev_col):
     return elev_col.diff(1).fillna(0)
 
@@ -71,12 +170,57 @@ def get_shifted_col(col):
     return col.shift(1)
 
 
-def calculate_haversine(list_de_lat_lon):
-    lat1, lon1, lat2, lon2 = list_de_lat_lon
-    return haversine(
-        (lat1, lon1), (lat2, lon2),
-        unit=Unit.METERS
+@th.timed('gpx.haversine', points=np.size)
+def calculate_haversine(lat1, lon1, lat2, lon2):
+    '''
+    Great-circle distance (meters) between arrays of coordinates
+
+    Parameters
+    ----------
+    lat1, lon1, lat2, lon2: array_like
+        latitudes/longitudes (degrees) of start and end points
+
+    Returns
+    -------
+    numpy.ndarray
+        distance between each pair of points
+    '''
+    lat1, lon1, lat2, lon2 = map(
+        lambda x: np.radians(np.asarray(x, dtype=np.float64)),
+        (lat1, lon1, lat2, lon2)
+    )
+    d = np.sin((lat2 - lat1) * 0.5) ** 2 \
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) * 0.5) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(d))
+
+
+def calculate_bearing(lat1, lon1, lat2, lon2):
+    '''
+    Initial bearing (degrees clockwise from north, [0, 360)) from start
+    to end point for arrays of coordinates
+
+    Parameters
+    ----------
+    lat1, lon1, lat2, lon2: array_like
+        latitudes/longitudes (degrees) of start and end points
+
+    Returns
+    -------
+    numpy.ndarray
+        bearing between each pair of points
+    '''
+    lat1, lon1, lat2, lon2 = map(
+        lambda x: np.radians(np.asarray(x, dtype=np.float64)),
+        (lat1, lon1, lat2, lon2)
     )
+    d_lon = lon2 - lon1
+    y = np.sin(d_lon) * np.cos(lat2)
+    x = np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(d_lon)
+    return (np.degrees(np.arctan2(y, x)) + 360) % 360
+
+
+def calculate_speed(dist_col, time_col):
+    return (dist_col / time_col * 3.6).fillna(0)
 
 
 def get_moving_average_col(col, ma=5):
@@ -93,13 +237,77 @@ def drop_cols(df, *args):
     return df.drop(columns=list(args))
 
 
-def time_to_tz_native(t, tz_in, tz_out):
-    return tz_in.localize(datetime.combine(datetime.today(), t)).astimezone(tz_out).time()
+@lru_cache(maxsize=1)
+def _timezone_finder():
+    # optional dependency, imported on first use since loading it is slow
+    try:
+        from timezonefinder import TimezoneFinder
+    except ImportError:
+        return None
+    return TimezoneFinder()
 
 
-def convert_timezone(time):
-    return time_to_tz_native(
-        time,
-        pytz.utc,
-        pytz.timezone(pytz.all_timezones[pytz.all_timezones.index('America/Chicago')])
-    )
+@th.timed('gpx.infer_timezone')
+def infer_timezone(latitude, longitude, default=DEFAULT_TIMEZONE):
+    '''
+    Infer IANA timezone name from coordinates; requires the optional
+    timezonefinder package, otherwise returns default
+
+    Parameters
+    ----------
+    latitude, longitude: float
+        coordinates (degrees), typically the activity's first point
+    default: str (default=DEFAULT_TIMEZONE)
+        timezone returned when inference is not possible
+
+    Returns
+    -------
+    str
+        IANA timezone name (e.g. 'America/Chicago')
+    '''
+    if pd.isna(latitude) or pd.isna(longitude) or _timezone_finder() is None:
+        return default
+    return _timezone_finder().timezone_at(lat=latitude, lng=longitude) or default
+
+
+@th.timed('gpx.convert_timezone', points=len)
+def convert_timezone(time_col, tz=DEFAULT_TIMEZONE):
+    '''
+    Convert UTC timestamps to tz-aware timestamps in the given timezone
+
+    Parameters
+    ----------
+    time_col: pandas.Series
+        UTC timestamps (naive or tz-aware)
+    tz: str (default=DEFAULT_TIMEZONE)
+        IANA timezone name
+
+    Returns
+    -------
+    pandas.Series
+        datetime64[ns, tz]
+    '''
+    return pd.to_datetime(time_col, utc=True).dt.tz_convert(tz)
+
+
+def get_time_elapsed(local_time_col):
+    '''
+    Seconds since local midnight of the first point; unlike clock-time
+    seconds this keeps increasing for activities crossing midnight
+
+    Parameters
+    ----------
+    local_time_col: pandas.Series
+        tz-aware timestamps returned by convert_timezone
+
+    Returns
+    -------
+    pandas.Series
+        int64 seconds
+    '''
+    start_of_day = local_time_col.iloc[0].normalize()
+    return (local_time_col - start_of_day).dt.total_seconds().astype(np.int64)
+
+
+def get_time_between(time_elapsed_col):
+    return time_elapsed_col.diff(1).fillna(0).astype(np.int64)
@@ -1,12 +1,90 @@
 import os
-import json
 import warnings; warnings.filterwarnings('ignore')
 
+import pandas as pd
+
 import GPXcleaner as gc
 import FITmanager as fm
+import PARQUETmanager as pm
+import SQLmanager as sq
+import ARCHIVEmanager as am
+import SCANhelper as sh
+import FILEhelper as fh
+import CURVEmanager as cv
+import SUMMARYmanager as sm
+import TILEmanager as tm
+import TIMEhelper as th
+
+
+# bump when the enriched frame changes so backed-up activities are reprocessed
+PIPELINE_VERSION = '1'
+
+# dtypes of the compact schema (see to_compact_frame)
+COMPACT_DTYPES = {
+    'elevation': 'float32',
+    'temperature': 'float32',
+    'elevation_diff': 'float32',
+    'distance': 'float32',
+    'time_elapsed': 'int32',
+    'speed_kmh': 'float32',
+    'speed_kmh_ma5': 'float32',
+    'gradient': 'float32',
+    'gradient_ma5': 'float32',
+    'heart_rate_ma5': 'float32',
+}
+COMPACT_INT_DTYPES = {
+    'heart_rate': 'UInt8',
+    'cadence': 'UInt8',
+    'power': 'UInt16',
+}
 
+# FIT record channels merged onto trackpoints during enrichment
+FIT_CHANNELS = ('power',)
 
-def raw_gpx_to_reuben_gpx(gpx_path):
+
+def activity_id_from_path(gpx_path):
+    '''
+    Activity ID of an exported file, e.g. .../activity_123.gpx -> '123'
+    '''
+    return sh.activity_id_from_name(os.path.basename(gpx_path))
+
+
+def attach_fit_channels(points_df, gpx_path, channels=FIT_CHANNELS, tolerance='1s'):
+    '''
+    Enrichment stage: merge FIT channels onto GPX trackpoints by nearest
+    timestamp; channels keep any GPX values where the FIT file has none
+
+    Parameters
+    ----------
+    points_df: pandas.DataFrame
+        frame returned by GPXcleaner.gpx_to_dataframe (UTC `time` column)
+    gpx_path: str
+        path to .gpx file; the .fit file is found with FITmanager.fit_path_from_gpx
+    channels: iterable of str (default=FIT_CHANNELS)
+        keys of FITmanager.FIT_FIELDS other than timestamp
+    tolerance: str or pandas.Timedelta (default='1s')
+        maximum distance between matched timestamps
+
+    Returns
+    -------
+    pandas.DataFrame
+        points_df with one column per channel
+    '''
+    fit_path = fm.fit_path_from_gpx(gpx_path)
+    if os.path.isfile(fit_path):
+        fit_data = fm.read_fit_fields(fit_path, fields=['timestamp', *channels])
+        aligned = fm.align_fit_fields(points_df['time'], fit_data, tolerance=tolerance)
+    else:
+        aligned = pd.DataFrame(index=points_df.index, columns=list(channels), dtype=float)
+
+    for channel in channels:
+        points_df[channel] = aligned[channel].combine_first(points_df[channel]) \
+            if channel in points_df else aligned[channel]
+    return points_df
+
+
+@th.timed('activity.enrich', points=len)
+def raw_gpx_to_reuben_gpx(gpx_path, timezone=None, compact=False):
     '''
     Converts activity.gpx -> pandas.DataFrame  -> activity.pkl
 
@@ -14,6 +92,10 @@ def raw_gpx_to_reuben_gpx(gpx_path):
     ----------
     gpx_path: str
         path to .gpx file
+    timezone: str (default=None)
+        IANA timezone for local_time; inferred from the first point if None
+    compact: bool (default=False)
+        return memory-optimized schema, see to_compact_frame
     
     Returns
     -------
@@ -26,8 +108,16 @@ def raw_gpx_to_reuben_gpx(gpx_path):
     # create copy of dataframe for security
     points_df = raw_df.copy()
 
+    # get power (watts) data aligned on trackpoint timestamps
+    points_df = attach_fit_channels(points_df, gpx_path)
+
     # add identifier column
-    points_df['activity_id'] = gpx_path[gpx_path.rfind('activity_') + 9:gpx_path.rfind('.gpx')]
+    points_df['activity_id'] = activity_id_from_path(gpx_path)
+
+    # convert UTC timestamps to local time before splitting date/time
+    if timezone is None:
+        timezone = gc.infer_timezone(points_df['latitude'].iloc[0], points_df['longitude'].iloc[0])
+    local_time = gc.convert_timezone(points_df['time'], tz=timezone)
 
     # convert date and time to respective datetime.objects
     points_df['date'] = gc.convert_date(points_df['time'])
@@ -41,21 +131,18 @@ def raw_gpx_to_reuben_gpx(gpx_path):
     points_df['proj_longitude'] = gc.get_shifted_col(points_df['longitude']).fillna(points_df['longitude'].iloc[0])
     
     # distance between observed point and n=1 future point
-    points_df['distance'] = points_df[['latitude', 'longitude', 'proj_latitude', 'proj_longitude']
-        ].apply(gc.calculate_haversine, axis=1)
+    points_df['distance'] = gc.calculate_haversine(
+        points_df['latitude'], points_df['longitude'],
+        points_df['proj_latitude'], points_df['proj_longitude']
+    )
     
-    # convert to local time
-    points_df['local_time'] = points_df['time'].apply(gc.convert_timezone)
+    # local time of day
+    points_df['local_time'] = local_time.dt.time
     
     # get time differences to calculate speeds
-    points_df['time_elapsed'] = points_df['local_time'].apply(
-        lambda x: (x.hour * 60**2) + (x.minute * 60**1) + (x.second * 60**0)
-    )
-    points_df['time_between_measure'] = points_df['time_elapsed'].diff(1).fillna(0).astype(int)
-    points_df['speed_kmh'] = points_df['speed_kmh'] = points_df[['distance', 'time_between_measure']].apply(lambda x: (x[0]/x[1]) * 3.6, axis=1).fillna(0)
-
-    # get power (watts) data
-    points_df['power'] = fm.return_power_data(gpx_path, n=points_df.shape[0])
+    points_df['time_elapsed'] = gc.get_time_elapsed(local_time)
+    points_df['time_between_measure'] = gc.get_time_between(points_df['time_elapsed'])
+    points_df['speed_kmh'] = gc.calculate_speed(points_df['distance'], points_df['time_between_measure'])
 
     # smooth (using moving average) speed and gradient
     points_df['speed_kmh_ma5'] = gc.get_moving_average_col(points_df['speed_kmh'])
@@ -63,51 +150,140 @@ def raw_gpx_to_reuben_gpx(gpx_path):
     points_df['gradient_ma5'] = gc.get_moving_average_col(points_df['gradient'])
     points_df['heart_rate_ma5'] = gc.get_moving_average_col(points_df['heart_rate'])
 
+    points_df = gc.drop_cols(points_df, 'time_between_measure', 'proj_latitude', 'proj_longitude')
+    if compact:
+        points_df = to_compact_frame(points_df, local_time)
+
     # return the bad boy
-    return gc.drop_cols(points_df, 'time_between_measure', 'proj_latitude', 'proj_longitude')
+    return points_df
 
 
-def write_to_id_dir(gpx_path, backup_dir, extension='pkl'):
+def to_compact_frame(points_df, local_time):
     '''
-    Navigating function for .gpx file to .pkl frame
+    Memory-optimized schema of the enriched frame: a single tz-aware `time`
+    column replaces date/time/local_time, derived metrics are float32,
+    heart rate/cadence/power are small nullable integers, and the activity
+    id moves from a repeated column to `attrs['activity_id']` (restored as a
+    column by the csv and parquet writers, see GPXcleaner.with_activity_id)
 
     Parameters
     ----------
+    points_df: pandas.DataFrame
+        frame built by raw_gpx_to_reuben_gpx
+    local_time: pandas.Series
+        tz-aware local timestamps returned by GPXcleaner.convert_timezone
+
+    Returns
+    -------
+    pandas.DataFrame
+    '''
+    activity_id = points_df['activity_id'].iloc[0]
+    compact_df = gc.drop_cols(points_df, 'activity_id', 'date', 'time', 'local_time')
+    compact_df.insert(0, 'time', local_time)
+
+    compact_df = compact_df.astype({
+        col: dtype
+        for col, dtype in COMPACT_DTYPES.items()
+        if col in compact_df
+    })
+    for col, dtype in COMPACT_INT_DTYPES.items():
+        if col in compact_df:
+            compact_df[col] = compact_df[col].round().astype(dtype)
+
+    compact_df.attrs['activity_id'] = activity_id
+    return compact_df
+
+
+def write_pkl(gpx_df, file_path):
+    gpx_df.to_pickle(file_path)
+
+
+def write_csv(gpx_df, file_path):
+    gc.with_activity_id(gpx_df).to_csv(file_path)
+
+
+# output writers keyed by file extension; each receives the enriched frame
+# produced once by raw_gpx_to_reuben_gpx
+WRITERS = {
+    'pkl': write_pkl,
+    'csv': write_csv,
+    'parquet': pm.write_activity_parquet,
+    'sqlite': sq.write_trackpoints,
+    'archive': am.write_activity_archive,
+    'curves': cv.write_activity_curves,
+    'summary': sm.write_activity_summary,
+    'tiles': tm.write_activity_tiles,
+}
+
+# outputs shared by all activities, written to <backup_dir>/<file> and
+# updated in place rather than skipped when they already exist
+SHARED_OUTPUTS = {
+    'sqlite': sq.DB_FILE,
+    'archive': am.ARCHIVE_FILE,
+    'summary': sm.SUMMARY_FILE,
+    'tiles': tm.TILE_FILE,
+}
+
+
+def write_atomic(writer, gpx_df, file_path):
+    '''
+    Run writer on a temporary file next to file_path and rename it into
+    place, so an interrupted write never leaves a truncated output behind
+    '''
+    with fh.atomic_path(file_path) as tmp_path:
+        writer(gpx_df, tmp_path)
+
+
+def write_to_id_dir(gpx_df, gpx_path, backup_dir, activity_index, extensions=('pkl',), overwrite=False):
+    '''
+    Navigating function for enriched activity frame to backup directory
+
+    Parameters
+    ----------
+    gpx_df: pandas.DataFrame
+        frame returned by raw_gpx_to_reuben_gpx
     gpx_path: str
-        path to .gpx file
+        path to .gpx file the frame was built from
     backup_dir: str
         path to backup directory
-    extension: str (default='pkl')
-        file extension for writing activity frame
+    activity_index: dict
+        activity ID -> backup directory, see JSONmanager.load_activity_index
+    extensions: iterable of str (default=('pkl',))
+        file extensions (keys of WRITERS) for writing activity frame
+    overwrite: bool (default=False)
+        replace outputs that already exist
     
     Returns
     -------
-    None
+    dict
+        keys: extension
+        vals: path of activity frame in backup directory
     '''
-    
-    gpx_df = raw_gpx_to_reuben_gpx(gpx_path)
-    gpx_file_id = gpx_path[gpx_path.rfind('_') + 1 : gpx_path.find('.gpx')]
 
-    activity_dirs = filter(lambda x: not (x.startswith('.') or x.endswith('.csv') or x.endswith('.pkl') or x.endswith('.json')), os.listdir(backup_dir))
-    for activity in activity_dirs:
-        if not activity in ['activities_reference.pkl', '.DS_Store', 'user_overview.json', 'activities_exhausted.pkl', 'activiites']:
-            activity_ids = json.load(open(f'{backup_dir}/{activity}/{activity.lower()}_ids.json'))
-            if int(gpx_file_id) in activity_ids:
-                gpx_file_dir = activity
+    unknown = set(extensions) - set(WRITERS)
+    if unknown:
+        raise ValueError(f'Unsupported output formats: {sorted(unknown)}')
 
-    gpx_file_dir = 'Cycling' if activity in ['Cycling', 'Road_Biking', 'Virtual_Ride'] else activity
+    with th.stage('activity.route'):
+        gpx_file_id = activity_id_from_path(gpx_path)
+        gpx_file_dir = activity_index[gpx_file_id]
 
-    gpx_file_path = f'{backup_dir}/{gpx_file_dir}/{gpx_file_id}.{extension}'
-    
-    if os.path.isfile(gpx_file_path):
-        return
+    output_paths = {}
+    for extension in extensions:
+        if extension in SHARED_OUTPUTS:
+            gpx_file_path = f'{backup_dir}/{SHARED_OUTPUTS[extension]}'
+        else:
+            gpx_file_path = f'{backup_dir}/{gpx_file_dir}/{gpx_file_id}.{extension}'
+        output_paths[extension] = gpx_file_path
+        
+        if os.path.isfile(gpx_file_path) and not (overwrite or extension in SHARED_OUTPUTS):
+            continue
+        
+        with th.stage(f'write.{extension}', points=gpx_df.shape[0]):
+            if extension in SHARED_OUTPUTS:
+                # shared outputs are updated transactionally by their writers
+                WRITERS[extension](gpx_df, gpx_file_path)
+            else:
+                write_atomic(WRITERS[extension], gpx_df, gpx_file_path)
     
-    if not os.path.isfile(gpx_file_path):
-        if extension == 'pkl':
-            gpx_df.to_pickle(gpx_file_path)
-        if extension == 'csv':
-            gpx_df.to_csv(gpx_file_path)
-        if extension == 'sql':
-            gpx_df.to_sql(gpx_file_path)
-    else:
-        print('uh-oh')
+    return output_paths
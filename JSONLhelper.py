@@ -0,0 +1,83 @@
+import os
+import json
+import threading
+
+import FILEhelper as fh
+
+
+# appends and compactions of the shared .jsonl tables must not interleave
+# when outputs are written on several threads
+_lock = threading.RLock()
+
+
+def append_entry(path, entry):
+    '''
+    Append one entry as a JSON line; an entry for a key already in the file
+    supersedes it, see read_entries
+
+    Parameters
+    ----------
+    path: str
+        path to .jsonl file, created if missing
+    entry: dict
+        JSON-serializable entry
+    '''
+    line = (json.dumps(entry) + '\n').encode('utf-8')
+    with _lock:
+        with open(path, 'a+b') as f:
+            # an interrupted append may have left an unterminated last line;
+            # end it first so this entry is not glued onto it and lost
+            if f.seek(0, os.SEEK_END):
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    line = b'\n' + line
+            f.write(line)
+
+
+def read_entries(path, key='activity_id'):
+    '''
+    Newest entry per key of a .jsonl file
+
+    Parameters
+    ----------
+    path: str
+        path to .jsonl file; empty if missing
+    key: str (default='activity_id')
+        field identifying an entry
+
+    Returns
+    -------
+    dict
+        keys: entry[key]
+        vals: newest entry, in order of last write
+    '''
+    entries = {}
+    if os.path.isfile(path):
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                # lines torn by an interrupted run do not parse and are skipped
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                entries.pop(entry[key], None)
+                entries[entry[key]] = entry
+    return entries
+
+
+def write_entries(path, entries):
+    '''
+    Replace a .jsonl file with entries, through a temporary file so an
+    interrupted rewrite leaves the old file in place
+    '''
+    with fh.atomic_path(path) as tmp_path:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.writelines(json.dumps(entry) + '\n' for entry in entries)
+
+
+def compact(path, key='activity_id'):
+    '''
+    Rewrite a .jsonl file keeping only the newest entry per key
+    '''
+    with _lock:
+        write_entries(path, read_entries(path, key).values())
@@ -2,9 +2,22 @@ import os
 import json
 from functools import reduce
 
-from pandas import concat
 from pandas.core.frame import DataFrame
 
+import PARQUETmanager as pm
+import SQLmanager as sq
+import SCANhelper as sh
+import TIMEhelper as th
+
+
+# activity types backed up together in the Cycling directory
+CYCLING_TYPES = ['Cycling', 'Road_Biking', 'Virtual_Ride']
+ACTIVITY_INDEX_FILE = 'activity_index.json'
+
+
+def activity_type_to_dir(activity_type):
+    return 'Cycling' if activity_type in CYCLING_TYPES else activity_type
+
 
 def generate_activity_directories(activity_types, activity_ids, backup_dir):
     '''
@@ -21,7 +34,9 @@ def generate_activity_directories(activity_types, activity_ids, backup_dir):
     
     Returns
     -------
-    None
+    dict
+        keys: activity ID (str)
+        vals: backup directory the activity is written to (see activity_type_to_dir)
 
     Raises
     ------
@@ -45,8 +60,53 @@ def generate_activity_directories(activity_types, activity_ids, backup_dir):
         assert os.path.isfile(f'{backup_dir}/{activity_key}/{activity_key.lower()}_ids.json'),\
             f'< FileNotFoundError: {activity_key} >'
 
+    # single ID -> directory index so routing activities is a dict lookup
+    activity_index = {
+        str(id): activity_type_to_dir(activity_key)
+        for activity_key, ids in backup_id_dict.items()
+        for id in ids
+    }
+    for activity_dir in set(activity_index.values()):
+        os.makedirs(f'{backup_dir}/{activity_dir}', exist_ok=True)
+
+    with open(f'{backup_dir}/{ACTIVITY_INDEX_FILE}', 'w', encoding='utf-8') as f:
+        json.dump(activity_index, f)
+    
+    return activity_index
+
+
+@th.timed('json.activity_index')
+def load_activity_index(backup_dir):
+    '''
+    Load ID -> directory index written by generate_activity_directories,
+    rebuilding it from the <type>_ids.json files if it is missing
+
+    Parameters
+    ----------
+    backup_dir: str
+        path to backup directory
+
+    Returns
+    -------
+    dict
+        keys: activity ID (str)
+        vals: backup directory name
+    '''
+    if os.path.isfile(f'{backup_dir}/{ACTIVITY_INDEX_FILE}'):
+        with open(f'{backup_dir}/{ACTIVITY_INDEX_FILE}', encoding='utf-8') as f:
+            return json.load(f)
+
+    activity_index = {}
+    for activity in sorted(os.listdir(backup_dir)):
+        ids_path = f'{backup_dir}/{activity}/{activity.lower()}_ids.json'
+        if os.path.isfile(ids_path):
+            with open(ids_path, encoding='utf-8') as f:
+                activity_index.update({str(id): activity_type_to_dir(activity) for id in json.load(f)})
+    return activity_index
+
 
-def gather_user_stats(export_dir, backup_dir):
+@th.timed('json.user_stats')
+def gather_user_stats(export_dir, backup_dir, inventory=None):
     '''
     Obtain user aggregate statistics, such as total activities performed,
     distance covered, time elapsed, calories burned, and elevation gained
@@ -57,6 +117,8 @@ def gather_user_stats(export_dir, backup_dir):
         path to export directory
     backup_dir: str
         path to backup directory
+    inventory: list of SCANhelper.ExportFile (default=None)
+        shared scan of export_dir; scanned here if None
 
     Returns
     -------
@@ -68,11 +130,10 @@ def gather_user_stats(export_dir, backup_dir):
     FileNotFoundError
         when json file is not written to backup directory
     '''
-    userstats_list = [
-        f'{export_dir}/{export}/userstats.json'
-        for export in sorted(os.listdir(export_dir))
-    ]
-    json_info = json.load(open(userstats_list[-1]))
+    if inventory is None:
+        inventory = sh.scan_export_dir(export_dir)
+    userstats_list = sh.select(inventory, name='userstats.json')
+    json_info = sh.load_payload(userstats_list[-1])
 
     user_overview_dict = {
         key : json_info['userMetrics'][0].get(key)
@@ -89,7 +150,8 @@ def gather_user_stats(export_dir, backup_dir):
     return user_overview_dict['totalActivities']
 
 
-def gather_activity_ids(export_dir):
+@th.timed('json.activity_ids')
+def gather_activity_ids(export_dir, inventory=None):
     '''
     Gather all unique activity IDs per subdirectory of export_dir
 
@@ -97,20 +159,37 @@ def gather_activity_ids(export_dir):
     ----------
     export_dir: str
         path to export directory
+    inventory: list of SCANhelper.ExportFile (default=None)
+        shared scan of export_dir; scanned here if None
     
     Returns
     -------
     list
         collection of all unique activity IDs
     '''
+    if inventory is None:
+        inventory = sh.scan_export_dir(export_dir)
     ids_list = [
-        json.load(open(f'{export_dir}/{export}/downloaded_ids.json'))['ids']
-        for export in os.listdir(export_dir)
+        downloaded['ids']
+        for downloaded in sh.load_payloads(sh.select(inventory, name='downloaded_ids.json'))
     ]
     return list(set(reduce(lambda x,y: x+y,ids_list)))
 
 
-def gather_exhaused_activities(export_dir, backup_dir):
+def extract_activity_type(activity_type):
+    return activity_type['typeKey'].title().replace('Indoor_', '')
+
+
+def drop_zero_cols(df):
+    '''
+    Drop numeric/boolean columns whose values are all zero (or missing)
+    '''
+    numeric_df = df.select_dtypes(include=['number', 'bool'])
+    return df.drop(columns=numeric_df.columns[(numeric_df.fillna(0) == 0).all()])
+
+
+@th.timed('json.activities')
+def gather_exhaused_activities(export_dir, backup_dir, formats=('pkl',), inventory=None):
     '''
     Gathers all json data from export subdirectories
 
@@ -120,6 +199,10 @@ def gather_exhaused_activities(export_dir, backup_dir):
         path to export directory
     backup_dir: str
         path to backup directory
+    formats: iterable of str (default=('pkl',))
+        formats ('pkl', 'parquet', 'sqlite') activities_exhausted is written to
+    inventory: list of SCANhelper.ExportFile (default=None)
+        shared scan of export_dir; scanned here if None
     
     Returns
     -------
@@ -129,30 +212,27 @@ def gather_exhaused_activities(export_dir, backup_dir):
     Raises
     ------
     FileNotFoundError
-        when .pkl file is not written to backup directory
+        when .pkl/.parquet file is not written to backup directory
     '''
-    data_list = []
-    act_json = [
-        json.load(open(f'{export_dir}/{export}/{file}'))
-        for export in os.listdir(export_dir)
-        for file in os.listdir(f'{export_dir}/{export}')
-        if file.startswith('activities-') and file.endswith('.json')
-    ]
-
-    for container in act_json:
-        if isinstance(container, list):
-            for activity in container:
-                data_list.append(DataFrame.from_dict(activity, orient='index').T)
-        else:
-            data_list.append(DataFrame.from_dict(container, orient='index').T)
-
-    activities_df = concat(data_list)\
-        .drop_duplicates(subset='activityId', keep='last')\
+    # stream containers into one record per activity (later exports win),
+    # flattening the nested activityType up front
+    if inventory is None:
+        inventory = sh.scan_export_dir(export_dir)
+    containers = sh.load_payloads(sh.select(inventory, kind='json', prefix='activities-'))
+
+    activities = {}
+    for container in containers:
+        for activity in (container if isinstance(container, list) else [container]):
+            activity = dict(activity)
+            activity['activityType'] = extract_activity_type(activity['activityType'])
+            activities.pop(activity['activityId'], None)
+            activities[activity['activityId']] = activity
+
+    activities_df = DataFrame.from_records(list(activities.values()))\
         .dropna(axis=1, how='all')\
         .sort_values('startTimeLocal')\
         .reset_index(drop=True)
-    activities_df.drop(columns=(activities_df.sum(axis=0) == 0).index[activities_df.sum(axis=0) == 0], inplace=True)
-    activities_df['activityType'] = activities_df['activityType'].apply(lambda x: x['typeKey'].title()).str.replace('Indoor_', '')
+    activities_df = drop_zero_cols(activities_df)
 
     generate_activity_directories(
         activities_df['activityType'],
@@ -160,7 +240,13 @@ def gather_exhaused_activities(export_dir, backup_dir):
         backup_dir
     )
 
-    activities_df.to_pickle(f'{backup_dir}/activities_exhausted.pkl')
-    assert os.path.isfile(f'{backup_dir}/activities_exhausted.pkl'), FileNotFoundError
+    if 'pkl' in formats:
+        activities_df.to_pickle(f'{backup_dir}/activities_exhausted.pkl')
+        assert os.path.isfile(f'{backup_dir}/activities_exhausted.pkl'), FileNotFoundError
+    if 'parquet' in formats:
+        pm.write_summary_parquet(activities_df, f'{backup_dir}/activities_exhausted.parquet')
+        assert os.path.isfile(f'{backup_dir}/activities_exhausted.parquet'), FileNotFoundError
+    if 'sqlite' in formats:
+        sq.write_summary(f'{backup_dir}/{sq.DB_FILE}', activities_df)
     
     return activities_df['activityId']
@@ -0,0 +1,188 @@
+import os
+import json
+import hashlib
+from functools import partial
+
+import GPXmanager as gm
+import FITmanager as fm
+import FILEhelper as fh
+
+
+MANIFEST_FILE = 'processing_manifest.json'
+
+# bytes read at a time when hashing source files
+HASH_BLOCK_SIZE = 1 << 20
+
+
+def load_manifest(backup_dir):
+    '''
+    Load record of processed activities from backup directory
+
+    Parameters
+    ----------
+    backup_dir: str
+        path to backup directory
+
+    Returns
+    -------
+    dict
+        keys: activity ID (str)
+        vals: dict(source, outputs, pipeline_version), see record_activity
+    '''
+    manifest_path = f'{backup_dir}/{MANIFEST_FILE}'
+    if not os.path.isfile(manifest_path):
+        return {}
+    with open(manifest_path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, backup_dir):
+    '''
+    Write manifest to backup directory; written to a temporary file first
+    so an interrupted run never leaves a truncated manifest behind
+    '''
+    manifest_path = f'{backup_dir}/{MANIFEST_FILE}'
+    with fh.atomic_path(manifest_path) as tmp_path:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+
+
+def _sha1(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(partial(f.read, HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _file_signature(path, with_hash=False):
+    if not os.path.isfile(path):
+        return None
+    stat = os.stat(path)
+    signature = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    if with_hash:
+        signature['sha1'] = _sha1(path)
+    return signature
+
+
+def source_paths(gpx_path):
+    '''
+    Paths of an activity's .gpx and .fit files, keyed like source_signature
+    '''
+    return {'gpx': gpx_path, 'fit': fm.fit_path_from_gpx(gpx_path)}
+
+
+def source_signature(gpx_path, with_hash=False):
+    '''
+    Size/mtime (and optionally content hash) of an activity's .gpx and .fit files
+
+    Parameters
+    ----------
+    gpx_path: str
+        path to .gpx file
+    with_hash: bool (default=False)
+        also compute sha1 of each file
+
+    Returns
+    -------
+    dict
+        keys: 'gpx', 'fit'
+        vals: dict(size, mtime_ns[, sha1]) or None if file is missing
+    '''
+    return {kind: _file_signature(path, with_hash) for kind, path in source_paths(gpx_path).items()}
+
+
+def _same_source(old, new, path):
+    '''
+    Compare a recorded file signature to the current one, hashing only when
+    the size matches but the mtime differs; fills new['sha1'] on a match
+    '''
+    if old is None or new is None:
+        return old is new
+    if old['size'] != new['size']:
+        return False
+    if old['mtime_ns'] == new['mtime_ns']:
+        new['sha1'] = old.get('sha1')
+        return True
+    new['sha1'] = _sha1(path)
+    return old.get('sha1') == new['sha1']
+
+
+def is_processed(manifest, gpx_path, backup_dir, extensions, compact=False):
+    '''
+    Check whether an activity is unchanged since it was last processed,
+    without parsing it
+
+    Unchanged means: processed by the current pipeline version and schema, every
+    requested output still exists, and the source files of the activity ID
+    match by size/mtime or, when only the mtime differs (e.g. the same
+    activity in a newer export snapshot), by content hash. Hash matches
+    refresh the recorded stat so the next run takes the fast path.
+
+    Parameters
+    ----------
+    manifest: dict
+        returned by load_manifest; source stats refreshed in place
+    gpx_path: str
+        path to .gpx file
+    backup_dir: str
+        path to backup directory
+    extensions: iterable of str
+        output formats the activity must have been written to
+    compact: bool (default=False)
+        whether outputs must use the compact schema
+
+    Returns
+    -------
+    bool
+    '''
+    entry = manifest.get(gm.activity_id_from_path(gpx_path))
+    if entry is None or entry.get('pipeline_version') != gm.PIPELINE_VERSION \
+            or entry.get('compact', False) != compact:
+        return False
+    if not all(
+        extension in entry['outputs'] and os.path.isfile(f"{backup_dir}/{entry['outputs'][extension]}")
+        for extension in extensions
+    ):
+        return False
+
+    signature = source_signature(gpx_path)
+    paths = source_paths(gpx_path)
+    if not all(_same_source(entry['source'][kind], signature[kind], paths[kind]) for kind in signature):
+        return False
+    entry['source'] = signature
+    return True
+
+
+def record_activity(manifest, gpx_path, backup_dir, output_paths, compact=False):
+    '''
+    Record a processed activity in the manifest
+
+    Parameters
+    ----------
+    manifest: dict
+        returned by load_manifest; updated in place
+    gpx_path: str
+        path to .gpx file
+    backup_dir: str
+        path to backup directory
+    output_paths: dict
+        keys: extension
+        vals: path written by GPXmanager.write_to_id_dir
+    compact: bool (default=False)
+        whether outputs use the compact schema
+    '''
+    activity_id = gm.activity_id_from_path(gpx_path)
+    entry = manifest.get(activity_id, {})
+    # outputs written with another schema are stale
+    outputs = entry.get('outputs', {}) if entry.get('compact', False) == compact else {}
+    outputs.update({
+        extension: os.path.relpath(path, backup_dir)
+        for extension, path in output_paths.items()
+    })
+    manifest[activity_id] = {
+        'source': source_signature(gpx_path, with_hash=True),
+        'outputs': outputs,
+        'pipeline_version': gm.PIPELINE_VERSION,
+        'compact': compact,
+    }
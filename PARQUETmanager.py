@@ -0,0 +1,86 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+import GPXcleaner as gc
+
+
+# requires the optional pyarrow package
+PARQUET_ENGINE = 'pyarrow'
+PARQUET_COMPRESSION = 'zstd'
+
+FLOAT32_COLUMNS = ['latitude', 'longitude', 'elevation']
+
+
+def activity_frame_to_parquet_frame(gpx_df):
+    '''
+    Convert frame returned by GPXmanager.raw_gpx_to_reuben_gpx to the
+    dtypes stored in parquet: float32 coordinates, categorical activity_id
+    and a single UTC datetime64 `time` column in place of date + time; the
+    activity_id column is restored for compact frames
+
+    Parameters
+    ----------
+    gpx_df: pandas.DataFrame
+        enriched activity frame
+
+    Returns
+    -------
+    pandas.DataFrame
+    '''
+    parquet_df = gc.with_activity_id(gpx_df)
+    if parquet_df is gpx_df:
+        parquet_df = gpx_df.copy()
+
+    for col in FLOAT32_COLUMNS:
+        if col in parquet_df:
+            parquet_df[col] = parquet_df[col].astype(np.float32)
+    if 'activity_id' in parquet_df:
+        parquet_df['activity_id'] = parquet_df['activity_id'].astype('category')
+    if 'date' in parquet_df:
+        parquet_df['time'] = gc.get_utc_time(parquet_df)
+        parquet_df = parquet_df.drop(columns=['date'])
+
+    return parquet_df
+
+
+def _to_text(value):
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return None if pd.isna(value) else str(value)
+
+
+def summary_to_parquet_frame(summary_df):
+    '''
+    Convert activity summary tables (activities_exhausted, activities_reference)
+    to parquet-safe dtypes; nested dict/list values are stored as JSON text
+
+    Parameters
+    ----------
+    summary_df: pandas.DataFrame
+
+    Returns
+    -------
+    pandas.DataFrame
+    '''
+    parquet_df = summary_df.infer_objects()
+
+    for col in parquet_df.columns[parquet_df.dtypes == object]:
+        parquet_df[col] = parquet_df[col].map(_to_text)
+
+    return parquet_df
+
+
+def write_activity_parquet(gpx_df, file_path):
+    activity_frame_to_parquet_frame(gpx_df).to_parquet(
+        file_path, engine=PARQUET_ENGINE, compression=PARQUET_COMPRESSION, index=False
+    )
+
+
+def write_summary_parquet(summary_df, file_path):
+    summary_to_parquet_frame(summary_df).to_parquet(
+        file_path, engine=PARQUET_ENGINE, compression=PARQUET_COMPRESSION, index=False
+    )
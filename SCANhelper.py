@@ -0,0 +1,202 @@
+import os
+import json
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from pandas import read_csv
+
+
+# one file in an export snapshot (<export_dir>/<export>/<name>)
+ExportFile = namedtuple(
+    'ExportFile',
+    ['path', 'export', 'name', 'kind', 'size', 'mtime', 'export_date']
+)
+
+
+def _export_date(export):
+    try:
+        return datetime.strptime(export[:export.find('_')], '%Y-%m-%d').date()
+    except ValueError:
+        return None
+
+
+def scan_export_dir(export_dir):
+    '''
+    Inventory every file of every export snapshot in a single pass
+
+    Parameters
+    ----------
+    export_dir: str
+        path to export directory
+
+    Returns
+    -------
+    list of ExportFile
+        sorted by export, then file name
+    '''
+    inventory = []
+    with os.scandir(export_dir) as exports:
+        exports = sorted((e for e in exports if e.is_dir()), key=lambda e: e.name)
+    for export in exports:
+        export_date = _export_date(export.name)
+        with os.scandir(export.path) as files:
+            files = sorted((f for f in files if f.is_file()), key=lambda f: f.name)
+        for file in files:
+            stat = file.stat()
+            inventory.append(ExportFile(
+                path=file.path,
+                export=export.name,
+                name=file.name,
+                kind=os.path.splitext(file.name)[1][1:].lower(),
+                size=stat.st_size,
+                mtime=stat.st_mtime,
+                export_date=export_date,
+            ))
+    return inventory
+
+
+def select(inventory, kind=None, prefix='', name=None):
+    '''
+    Filter inventory by file kind (extension), name prefix or exact name
+
+    Parameters
+    ----------
+    inventory: list of ExportFile
+        returned by scan_export_dir
+    kind: str (default=None)
+        file extension without dot, e.g. 'json'
+    prefix: str (default='')
+        file name prefix, e.g. 'activities-'
+    name: str (default=None)
+        exact file name, e.g. 'userstats.json'
+
+    Returns
+    -------
+    list of ExportFile
+    '''
+    return [
+        entry for entry in inventory
+        if (kind is None or entry.kind == kind)
+        and entry.name.startswith(prefix)
+        and (name is None or entry.name == name)
+    ]
+
+
+def load_payload(entry, **read_csv_kwargs):
+    '''
+    Load a JSON or CSV export file
+
+    Parameters
+    ----------
+    entry: ExportFile
+    **read_csv_kwargs
+        passed to pandas.read_csv for CSV files
+
+    Returns
+    -------
+    object
+        parsed JSON, or pandas.DataFrame for CSV files
+    '''
+    if entry.kind == 'json':
+        with open(entry.path, encoding='utf-8') as f:
+            return json.load(f)
+    if entry.kind == 'csv':
+        return read_csv(entry.path, **read_csv_kwargs)
+    raise ValueError(f'Unsupported export file: {entry.path}')
+
+
+def load_payloads(entries, max_workers=8, **read_csv_kwargs):
+    '''
+    Load export files concurrently on a thread pool; reads are I/O bound,
+    which matters most on network-mounted export directories
+
+    Parameters
+    ----------
+    entries: list of ExportFile
+    max_workers: int (default=8)
+        number of reader threads
+    **read_csv_kwargs
+        passed to load_payload
+
+    Returns
+    -------
+    list
+        payloads in the same order as entries
+    '''
+    if len(entries) <= 1:
+        return [load_payload(entry, **read_csv_kwargs) for entry in entries]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(lambda entry: load_payload(entry, **read_csv_kwargs), entries))
+
+
+def drop_superseded(inventory):
+    '''
+    Remove export snapshots whose activities are all contained in a newer
+    snapshot, judged by each snapshot's downloaded_ids.json; snapshots
+    without that file are always kept
+
+    Since every full export repeats the whole history, this leaves the
+    summary readers (activities-*.json, activities*.csv) with only the
+    newest snapshot instead of one copy of the history per snapshot
+
+    Parameters
+    ----------
+    inventory: list of ExportFile
+        returned by scan_export_dir
+
+    Returns
+    -------
+    list of ExportFile
+        entries of snapshots that are not superseded
+    '''
+    downloaded = select(inventory, name='downloaded_ids.json')
+    ids_by_export = {
+        entry.export: set(payload['ids'])
+        for entry, payload in zip(downloaded, load_payloads(downloaded))
+    }
+
+    # newest first: (export date, export name)
+    ordered = sorted(ids_by_export, key=lambda e: (_export_date(e) or datetime.min.date(), e), reverse=True)
+    superseded = {
+        export
+        for i, export in enumerate(ordered)
+        if any(ids_by_export[export] <= ids_by_export[newer] for newer in ordered[:i])
+    }
+    return [entry for entry in inventory if entry.export not in superseded]
+
+
+def resolve_latest_activities(inventory, kind='gpx'):
+    '''
+    Newest-wins map of activity ID to export file across all snapshots,
+    built from file names alone so nothing is parsed
+
+    Parameters
+    ----------
+    inventory: list of ExportFile
+        returned by scan_export_dir
+    kind: str (default='gpx')
+        activity file kind
+
+    Returns
+    -------
+    dict
+        keys: activity ID (str)
+        vals: ExportFile from the newest snapshot containing the activity
+    '''
+    latest = {}
+    for entry in sorted(
+        select(inventory, kind=kind, prefix='activity_'),
+        key=lambda e: (e.export_date or datetime.min.date(), e.export)
+    ):
+        latest[activity_id_from_name(entry.name)] = entry
+    return latest
+
+
+def activity_id_from_name(name):
+    '''
+    Activity ID of an exported file name, e.g. activity_123.gpx -> '123';
+    GPXmanager.activity_id_from_path applies the same rule to paths
+    '''
+    name = os.path.splitext(name)[0]
+    return name[name.rfind('_') + 1:]
@@ -0,0 +1,223 @@
+import sqlite3
+
+import pandas as pd
+
+import GPXcleaner as gc
+
+
+DB_FILE = 'activities.sqlite'
+BATCH_SIZE = 5000
+
+# activities_exhausted column -> summary table column
+SUMMARY_COLUMNS = {
+    'activityId': 'activity_id',
+    'activityType': 'activity_type',
+    'startTimeLocal': 'start_time',
+    'activityName': 'activity_name',
+    'distance': 'distance',
+    'duration': 'duration',
+    'elevationGain': 'elevation_gain',
+    'averageHR': 'average_hr',
+    'maxHR': 'max_hr',
+    'calories': 'calories',
+}
+TRACKPOINT_COLUMNS = [
+    'latitude', 'longitude', 'elevation', 'heart_rate', 'cadence',
+    'temperature', 'power', 'distance', 'speed_kmh', 'gradient',
+]
+
+# stored in PRAGMA user_version once SCHEMA is created; bump when it changes
+SCHEMA_VERSION = 1
+
+SCHEMA = f'''
+CREATE TABLE IF NOT EXISTS activities (
+    activity_id INTEGER PRIMARY KEY,
+    activity_type TEXT,
+    start_time TEXT,
+    activity_name TEXT,
+    distance REAL,
+    duration REAL,
+    elevation_gain REAL,
+    average_hr REAL,
+    max_hr REAL,
+    calories REAL,
+    data TEXT
+);
+CREATE INDEX IF NOT EXISTS activities_type_idx ON activities (activity_type);
+CREATE INDEX IF NOT EXISTS activities_start_time_idx ON activities (start_time);
+
+CREATE TABLE IF NOT EXISTS trackpoints (
+    activity_id INTEGER NOT NULL,
+    seq INTEGER NOT NULL,
+    time TEXT,
+    {', '.join(f'{col} REAL' for col in TRACKPOINT_COLUMNS)},
+    PRIMARY KEY (activity_id, seq)
+) WITHOUT ROWID;
+'''
+
+
+def connect(db_path):
+    '''
+    Open (and create if needed) the activity store
+
+    Parameters
+    ----------
+    db_path: str
+        path to .sqlite file, typically <backup_dir>/DB_FILE
+
+    Returns
+    -------
+    sqlite3.Connection
+    '''
+    # long timeout since WriterPool threads each open a connection and may
+    # write concurrently
+    conn = sqlite3.connect(db_path, timeout=60)
+    conn.execute('PRAGMA synchronous=NORMAL')
+    # the schema (and WAL mode, which persists in the file) is set up once
+    # per store rather than on every per-activity write
+    if conn.execute('PRAGMA user_version').fetchone()[0] < SCHEMA_VERSION:
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript(SCHEMA)
+        conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+    return conn
+
+
+def _to_rows(df):
+    return df.astype(object).where(df.notna(), None).itertuples(index=False, name=None)
+
+
+def _executemany_batched(conn, sql, rows, batch_size=BATCH_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            conn.executemany(sql, batch)
+            batch = []
+    if batch:
+        conn.executemany(sql, batch)
+
+
+def write_summary(db_path, activities_df, batch_size=BATCH_SIZE):
+    '''
+    Replace the activities summary table with activities_df (the frame
+    written to activities_exhausted.pkl); the full record is kept as JSON
+    in `data`
+
+    Parameters
+    ----------
+    db_path: str
+        path to .sqlite file
+    activities_df: pandas.DataFrame
+        frame built by JSONmanager.gather_exhaused_activities
+    batch_size: int (default=BATCH_SIZE)
+        rows per executemany call
+    '''
+    summary_df = pd.DataFrame({
+        col: activities_df[key] if key in activities_df else None
+        for key, col in SUMMARY_COLUMNS.items()
+    })
+    summary_df['data'] = activities_df.to_json(orient='records', lines=True, date_format='iso').splitlines()
+
+    conn = connect(db_path)
+    try:
+        with conn:
+            conn.execute('DELETE FROM activities')
+            _executemany_batched(
+                conn,
+                f'INSERT INTO activities ({", ".join(summary_df.columns)}) '
+                f'VALUES ({", ".join("?" * summary_df.shape[1])})',
+                _to_rows(summary_df),
+                batch_size
+            )
+    finally:
+        conn.close()
+
+
+def write_trackpoints(gpx_df, db_path, batch_size=BATCH_SIZE):
+    '''
+    Replace one activity's trackpoints in a single transaction
+
+    Parameters
+    ----------
+    gpx_df: pandas.DataFrame
+        frame returned by GPXmanager.raw_gpx_to_reuben_gpx
+    db_path: str
+        path to .sqlite file
+    batch_size: int (default=BATCH_SIZE)
+        rows per executemany call
+    '''
+    activity_id = int(gc.get_activity_id(gpx_df))
+
+    points_df = pd.DataFrame({
+        'activity_id': activity_id,
+        'seq': range(gpx_df.shape[0]),
+        'time': gc.get_utc_time(gpx_df).dt.strftime('%Y-%m-%dT%H:%M:%SZ').values,
+        **{
+            col: gpx_df[col].values if col in gpx_df else None
+            for col in TRACKPOINT_COLUMNS
+        }
+    })
+
+    conn = connect(db_path)
+    try:
+        with conn:
+            conn.execute('DELETE FROM trackpoints WHERE activity_id = ?', (activity_id,))
+            _executemany_batched(
+                conn,
+                f'INSERT INTO trackpoints ({", ".join(points_df.columns)}) '
+                f'VALUES ({", ".join("?" * points_df.shape[1])})',
+                _to_rows(points_df),
+                batch_size
+            )
+    finally:
+        conn.close()
+
+
+def query_trackpoints(db_path, activity_type=None, start=None, end=None, columns=None):
+    '''
+    Trackpoints of activities filtered by type and local start time, using
+    the activities indexes and the trackpoints primary key
+
+    Parameters
+    ----------
+    db_path: str
+        path to .sqlite file
+    activity_type: str or list of str (default=None)
+        e.g. 'Cycling' or ['Cycling', 'Road_Biking', 'Virtual_Ride']
+    start, end: str (default=None)
+        inclusive/exclusive bounds on local start time, e.g. '2023-01-01'
+    columns: list of str (default=None)
+        trackpoint columns to return; all if None
+
+    Returns
+    -------
+    pandas.DataFrame
+
+    Example
+    -------
+    >>> query_trackpoints(db_path, 'Cycling', '2023-01-01', '2024-01-01')
+    '''
+    columns = ['activity_id', 'seq', 'time', *TRACKPOINT_COLUMNS] if columns is None else columns
+    conditions, params = [], []
+    if activity_type is not None:
+        activity_types = [activity_type] if isinstance(activity_type, str) else list(activity_type)
+        conditions.append(f'a.activity_type IN ({", ".join("?" * len(activity_types))})')
+        params.extend(activity_types)
+    if start is not None:
+        conditions.append('a.start_time >= ?')
+        params.append(start)
+    if end is not None:
+        conditions.append('a.start_time < ?')
+        params.append(end)
+
+    sql = f'''
+        SELECT {", ".join(f"t.{col}" for col in columns)}
+        FROM activities a JOIN trackpoints t ON t.activity_id = a.activity_id
+        {"WHERE " + " AND ".join(conditions) if conditions else ""}
+        ORDER BY t.activity_id, t.seq
+    '''
+    conn = connect(db_path)
+    try:
+        return pd.read_sql_query(sql, conn, params=params)
+    finally:
+        conn.close()
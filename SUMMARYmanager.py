@@ -0,0 +1,158 @@
+import numpy as np
+import pandas as pd
+
+import GPXcleaner as gc
+import JSONLhelper as jh
+
+
+SUMMARY_FILE = 'activity_summaries.jsonl'
+
+# below this speed (km/h) a trackpoint does not count towards moving time
+MOVING_SPEED_KMH = 1.0
+
+# summary columns, in table order
+SUMMARY_COLUMNS = [
+    'activity_id', 'start_time', 'end_time', 'points',
+    'distance_m', 'elapsed_time_s', 'moving_time_s', 'elevation_gain_m',
+    'avg_speed_kmh', 'max_speed_kmh', 'avg_heart_rate', 'max_heart_rate',
+    'avg_power', 'max_power',
+    'min_latitude', 'min_longitude', 'max_latitude', 'max_longitude',
+]
+
+
+def _stat(gpx_df, column, func):
+    if column not in gpx_df:
+        return None
+    values = gpx_df[column].to_numpy(dtype=np.float64, na_value=np.nan)
+    if np.isnan(values).all():
+        return None
+    return round(float(func(values)), 3)
+
+
+def summarize_activity(gpx_df):
+    '''
+    Summary statistics of one enriched activity frame
+
+    Parameters
+    ----------
+    gpx_df: pandas.DataFrame
+        frame returned by GPXmanager.raw_gpx_to_reuben_gpx (either schema)
+
+    Returns
+    -------
+    dict
+        keys: SUMMARY_COLUMNS
+    '''
+    utc_time = gc.get_utc_time(gpx_df)
+    seconds_between = utc_time.diff().dt.total_seconds().fillna(0).to_numpy()
+    speed = gpx_df['speed_kmh'].to_numpy(dtype=np.float64, na_value=np.nan)
+    moving_time = float(seconds_between[np.nan_to_num(speed) >= MOVING_SPEED_KMH].sum())
+    distance = float(np.nansum(gpx_df['distance'].to_numpy(dtype=np.float64, na_value=np.nan)))
+
+    return {
+        # string ID, as keyed by the tile index, archive index and manifest
+        'activity_id': str(gc.get_activity_id(gpx_df)),
+        'start_time': utc_time.iloc[0].isoformat(),
+        'end_time': utc_time.iloc[-1].isoformat(),
+        'points': int(gpx_df.shape[0]),
+        'distance_m': round(distance, 3),
+        'elapsed_time_s': float((utc_time.iloc[-1] - utc_time.iloc[0]).total_seconds()),
+        'moving_time_s': moving_time,
+        'elevation_gain_m': _stat(gpx_df, 'elevation_diff', lambda v: np.nansum(np.clip(v, 0, None))),
+        'avg_speed_kmh': round(distance / moving_time * 3.6, 3) if moving_time else None,
+        # smoothed speed, since single GPS jumps produce unrealistic maxima
+        'max_speed_kmh': _stat(gpx_df, 'speed_kmh_ma5' if 'speed_kmh_ma5' in gpx_df else 'speed_kmh', np.nanmax),
+        'avg_heart_rate': _stat(gpx_df, 'heart_rate', np.nanmean),
+        'max_heart_rate': _stat(gpx_df, 'heart_rate', np.nanmax),
+        'avg_power': _stat(gpx_df, 'power', np.nanmean),
+        'max_power': _stat(gpx_df, 'power', np.nanmax),
+        'min_latitude': _stat(gpx_df, 'latitude', np.nanmin),
+        'min_longitude': _stat(gpx_df, 'longitude', np.nanmin),
+        'max_latitude': _stat(gpx_df, 'latitude', np.nanmax),
+        'max_longitude': _stat(gpx_df, 'longitude', np.nanmax),
+    }
+
+
+def write_activity_summary(gpx_df, summary_path):
+    '''
+    Append one activity's summary (GPXmanager.WRITERS['summary']); a
+    re-processed activity is appended again and the newest line wins
+    (see load_summaries, compact_summaries)
+
+    Parameters
+    ----------
+    gpx_df: pandas.DataFrame
+        frame returned by GPXmanager.raw_gpx_to_reuben_gpx
+    summary_path: str
+        path to summary table, typically <backup_dir>/SUMMARY_FILE
+    '''
+    jh.append_entry(summary_path, summarize_activity(gpx_df))
+
+
+def load_summaries(backup_dir):
+    '''
+    Summary table of every processed activity, newest summary per activity
+
+    Parameters
+    ----------
+    backup_dir: str
+        path to backup directory
+
+    Returns
+    -------
+    pandas.DataFrame
+        cols: SUMMARY_COLUMNS; activity_id as str, start_time/end_time as
+        UTC datetimes
+
+    Example
+    -------
+    >>> summaries_df = load_summaries(backup_dir)
+    >>> summaries_df[summaries_df['start_time'].dt.year == 2023]['elevation_gain_m'].sum()
+    '''
+    summaries_df = pd.DataFrame.from_records(
+        list(jh.read_entries(f'{backup_dir}/{SUMMARY_FILE}').values()),
+        columns=SUMMARY_COLUMNS
+    )
+    # tables written before IDs were stored as str hold int IDs; the newest
+    # line per activity still wins once both are str
+    summaries_df['activity_id'] = summaries_df['activity_id'].astype(str)
+    summaries_df = summaries_df.drop_duplicates('activity_id', keep='last')
+    for col in ['start_time', 'end_time']:
+        summaries_df[col] = pd.to_datetime(summaries_df[col], utc=True)
+    return summaries_df.sort_values('start_time').reset_index(drop=True)
+
+
+def join_activities(backup_dir, summaries_df=None):
+    '''
+    Join the summary table onto activities_exhausted.pkl by activityId
+
+    Parameters
+    ----------
+    backup_dir: str
+        path to backup directory
+    summaries_df: pandas.DataFrame (default=None)
+        returned by load_summaries; loaded here if None
+
+    Returns
+    -------
+    pandas.DataFrame
+        activities_exhausted rows with the summary columns (NaN for
+        activities without a processed GPX file)
+
+    Example
+    -------
+    >>> join_activities(backup_dir).groupby('activityType')['avg_heart_rate'].mean()
+    '''
+    if summaries_df is None:
+        summaries_df = load_summaries(backup_dir)
+    activities_df = pd.read_pickle(f'{backup_dir}/activities_exhausted.pkl')
+    summaries_df = summaries_df.rename(columns={'activity_id': 'activityId'})
+    summaries_df['activityId'] = summaries_df['activityId'].astype(activities_df['activityId'].dtype)
+    return activities_df.merge(summaries_df, on='activityId', how='left')
+
+
+def compact_summaries(backup_dir):
+    '''
+    Rewrite the summary table keeping only the newest line per activity
+    '''
+    jh.compact(f'{backup_dir}/{SUMMARY_FILE}')
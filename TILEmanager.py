@@ -0,0 +1,272 @@
+import math
+
+import numpy as np
+
+import GPXcleaner as gc
+import JSONLhelper as jh
+
+
+TILE_FILE = 'tile_index.jsonl'
+
+# fixed grid tile size in degrees (~1.1 km of latitude)
+TILE_DEG = 0.01
+
+def tile_key(ix, iy):
+    return f'{ix},{iy}'
+
+
+def activity_tiles(gpx_df, tile_deg=TILE_DEG):
+    '''
+    Grid tiles an activity passes through, with the point ranges spent in
+    each; consecutive points in one tile form a single range
+
+    Parameters
+    ----------
+    gpx_df: pandas.DataFrame
+        frame returned by GPXmanager.raw_gpx_to_reuben_gpx (either schema)
+    tile_deg: float (default=TILE_DEG)
+        tile size in degrees
+
+    Returns
+    -------
+    dict
+        keys: tile key 'ix,iy' (floor of longitude/latitude over tile_deg)
+        vals: list of [start, end) point index ranges
+    '''
+    latitude = gpx_df['latitude'].to_numpy(dtype=np.float64)
+    longitude = gpx_df['longitude'].to_numpy(dtype=np.float64)
+    valid = ~(np.isnan(latitude) | np.isnan(longitude))
+
+    # invalid points get a sentinel tile so they split runs and are skipped
+    sentinel = np.iinfo(np.int64).min
+    ix = np.where(valid, np.floor(np.nan_to_num(longitude) / tile_deg), sentinel).astype(np.int64)
+    iy = np.where(valid, np.floor(np.nan_to_num(latitude) / tile_deg), sentinel).astype(np.int64)
+
+    changes = np.flatnonzero((ix[1:] != ix[:-1]) | (iy[1:] != iy[:-1])) + 1
+    starts = np.concatenate([[0], changes])
+    ends = np.concatenate([changes, [latitude.size]])
+
+    tiles = {}
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        if ix[start] == sentinel:
+            continue
+        tiles.setdefault(tile_key(ix[start], iy[start]), []).append([start, end])
+    return tiles
+
+
+def write_activity_tiles(gpx_df, tile_path):
+    '''
+    Append one activity's tiles (GPXmanager.WRITERS['tiles']); a
+    re-processed activity is appended again and the newest line wins
+    (see load_tile_index, compact_tile_index)
+
+    Parameters
+    ----------
+    gpx_df: pandas.DataFrame
+        frame returned by GPXmanager.raw_gpx_to_reuben_gpx
+    tile_path: str
+        path to tile index, typically <backup_dir>/TILE_FILE
+    '''
+    jh.append_entry(tile_path, {
+        'activity_id': str(gc.get_activity_id(gpx_df)),
+        'tile_deg': TILE_DEG,
+        'tiles': activity_tiles(gpx_df, TILE_DEG),
+    })
+
+
+def load_tile_index(backup_dir):
+    '''
+    Inverted tile index of every processed activity
+
+    Parameters
+    ----------
+    backup_dir: str
+        path to backup directory
+
+    Returns
+    -------
+    dict
+        tile_deg: float, tile size of the index
+        tiles: dict, tile key -> {activity ID (str): [[start, end), ...]}
+        activities: dict, activity ID (str) -> set of tile keys
+    '''
+    entries = jh.read_entries(f'{backup_dir}/{TILE_FILE}')
+    tile_sizes = {entry['tile_deg'] for entry in entries.values()}
+    assert len(tile_sizes) <= 1, f'Mixed tile sizes {sorted(tile_sizes)}; rebuild {TILE_FILE}'
+
+    tiles = {}
+    for activity_id, entry in entries.items():
+        for key, ranges in entry['tiles'].items():
+            tiles.setdefault(key, {})[activity_id] = ranges
+    return {
+        'tile_deg': tile_sizes.pop() if tile_sizes else TILE_DEG,
+        'tiles': tiles,
+        'activities': {activity_id: set(entry['tiles']) for activity_id, entry in entries.items()},
+    }
+
+
+def _collect(tile_index, keys):
+    candidates = {}
+    for key in keys:
+        for activity_id, ranges in tile_index['tiles'].get(key, {}).items():
+            candidates.setdefault(activity_id, []).extend(ranges)
+    return {activity_id: sorted(ranges) for activity_id, ranges in candidates.items()}
+
+
+def _cells(tile_index, min_ix, max_ix, min_iy, max_iy):
+    '''
+    Grid cells (ix, iy arrays) in an inclusive index range; enumerated when
+    the range is small, otherwise filtered from the indexed tiles so a query
+    costs no more than the index size however large its area
+    '''
+    if (max_ix - min_ix + 1) * (max_iy - min_iy + 1) <= len(tile_index['tiles']):
+        ix, iy = np.meshgrid(np.arange(min_ix, max_ix + 1), np.arange(min_iy, max_iy + 1))
+        return ix.ravel(), iy.ravel()
+    indexed = np.array([key.split(',') for key in tile_index['tiles']], dtype=np.int64).reshape(-1, 2)
+    inside = (indexed[:, 0] >= min_ix) & (indexed[:, 0] <= max_ix) \
+        & (indexed[:, 1] >= min_iy) & (indexed[:, 1] <= max_iy)
+    return indexed[inside, 0], indexed[inside, 1]
+
+
+def query_bbox(tile_index, min_latitude, min_longitude, max_latitude, max_longitude):
+    '''
+    Activities with points in tiles overlapping a bounding box
+
+    Parameters
+    ----------
+    tile_index: dict
+        returned by load_tile_index
+    min_latitude, min_longitude, max_latitude, max_longitude: float
+        bounding box (degrees)
+
+    Returns
+    -------
+    dict
+        keys: activity ID (str)
+        vals: sorted [start, end) point ranges inside candidate tiles; refine
+        with points_within after loading only these activities
+
+    Example
+    -------
+    >>> query_bbox(load_tile_index(backup_dir), 40.08, -88.30, 40.13, -88.20)
+    '''
+    tile_deg = tile_index['tile_deg']
+    ix, iy = _cells(
+        tile_index,
+        math.floor(min_longitude / tile_deg), math.floor(max_longitude / tile_deg),
+        math.floor(min_latitude / tile_deg), math.floor(max_latitude / tile_deg)
+    )
+    return _collect(tile_index, [tile_key(x, y) for x, y in zip(ix.tolist(), iy.tolist())])
+
+
+def query_radius(tile_index, latitude, longitude, radius_m):
+    '''
+    Activities with points in tiles within radius_m of a location
+
+    Parameters
+    ----------
+    tile_index: dict
+        returned by load_tile_index
+    latitude, longitude: float
+        center (degrees)
+    radius_m: float
+        radius in meters
+
+    Returns
+    -------
+    dict
+        see query_bbox
+    '''
+    tile_deg = tile_index['tile_deg']
+    dlat = math.degrees(radius_m / gc.EARTH_RADIUS_M)
+    dlon = dlat / max(math.cos(math.radians(latitude)), 1e-6)
+
+    ix, iy = _cells(
+        tile_index,
+        math.floor((longitude - dlon) / tile_deg), math.floor((longitude + dlon) / tile_deg),
+        math.floor((latitude - dlat) / tile_deg), math.floor((latitude + dlat) / tile_deg)
+    )
+    # nearest point of each tile to the center
+    nearest_lat = np.clip(latitude, iy * tile_deg, (iy + 1) * tile_deg)
+    nearest_lon = np.clip(longitude, ix * tile_deg, (ix + 1) * tile_deg)
+    within = gc.calculate_haversine(latitude, longitude, nearest_lat, nearest_lon) <= radius_m
+    return _collect(tile_index, [tile_key(x, y) for x, y in zip(ix[within].tolist(), iy[within].tolist())])
+
+
+def points_within(gpx_df, ranges, min_latitude=None, min_longitude=None, max_latitude=None,
+                  max_longitude=None, center=None, radius_m=None):
+    '''
+    Exact points of a candidate activity inside a bounding box or radius,
+    checking only the point ranges returned by query_bbox/query_radius
+
+    Parameters
+    ----------
+    gpx_df: pandas.DataFrame
+        backed-up activity frame
+    ranges: list of [start, end)
+        point ranges of the activity returned by a query
+    min_latitude, min_longitude, max_latitude, max_longitude: float
+        bounding box (degrees)
+    center: tuple(float, float)
+        (latitude, longitude) for a radius query
+    radius_m: float
+        radius in meters
+
+    Returns
+    -------
+    numpy.ndarray
+        positional indices of matching points
+    '''
+    positions = np.concatenate([np.arange(start, end) for start, end in ranges]) \
+        if ranges else np.zeros(0, dtype=np.int64)
+    latitude = gpx_df['latitude'].to_numpy(dtype=np.float64)[positions]
+    longitude = gpx_df['longitude'].to_numpy(dtype=np.float64)[positions]
+
+    if center is not None:
+        inside = gc.calculate_haversine(center[0], center[1], latitude, longitude) <= radius_m
+    else:
+        inside = (latitude >= min_latitude) & (latitude <= max_latitude) \
+            & (longitude >= min_longitude) & (longitude <= max_longitude)
+    return positions[inside]
+
+
+def similar_activities(tile_index, activity_id, min_overlap=0.8):
+    '''
+    Activities covering largely the same tiles as activity_id, e.g. repeats
+    of a route, by Jaccard overlap of their tile sets
+
+    Parameters
+    ----------
+    tile_index: dict
+        returned by load_tile_index
+    activity_id: str or int
+    min_overlap: float (default=0.8)
+        minimum |A & B| / |A | B|
+
+    Returns
+    -------
+    list of tuple(str, float)
+        activity IDs and overlaps, best first
+    '''
+    tiles = tile_index['activities'][str(activity_id)]
+    candidates = {
+        other
+        for key in tiles
+        for other in tile_index['tiles'].get(key, {})
+        if other != str(activity_id)
+    }
+    overlaps = [
+        (other, len(tiles & tile_index['activities'][other]) / len(tiles | tile_index['activities'][other]))
+        for other in candidates
+    ]
+    return sorted(
+        [(other, overlap) for other, overlap in overlaps if overlap >= min_overlap],
+        key=lambda item: item[1], reverse=True
+    )
+
+
+def compact_tile_index(backup_dir):
+    '''
+    Rewrite the tile index keeping only the newest line per activity
+    '''
+    jh.compact(f'{backup_dir}/{TILE_FILE}')
@@ -0,0 +1,261 @@
+import os
+import json
+import threading
+from time import perf_counter
+from functools import wraps
+from contextlib import contextmanager
+from collections import namedtuple
+
+import numpy as np
+from pandas.core.frame import DataFrame
+
+import rich
+from rich.table import Table
+
+
+# one timed call: stage name, seconds, trackpoints handled (or None) and the
+# activity being processed (or None outside process_activity)
+Timing = namedtuple('Timing', ['stage', 'seconds', 'points', 'activity_id'])
+
+# timings of this process; worker processes return theirs with drain()
+_timings = []
+_local = threading.local()
+
+# timings are only recorded once enable() is called (gcfm, benchmarks) or
+# inside activity(), so library callers such as notebooks or query loops
+# running timed functions do not accumulate records
+_enabled = False
+
+
+class _Stage:
+    '''
+    Handle yielded by stage(); set `points` inside the block when the
+    number of trackpoints is only known after the work is done
+    '''
+    def __init__(self, points=None):
+        self.points = points
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def recording():
+    '''
+    Whether timings are recorded on this thread, see enable and activity
+    '''
+    return _enabled or getattr(_local, 'activity_id', None) is not None
+
+
+@contextmanager
+def stage(name, points=None):
+    '''
+    Time a block of code as one call of stage `name`; not recorded unless
+    recording() holds
+
+    Parameters
+    ----------
+    name: str
+        stage name, e.g. 'gpx.parse'
+    points: int (default=None)
+        trackpoints handled, used for points/second
+
+    Example
+    -------
+    >>> with stage('write.csv', points=gpx_df.shape[0]):
+    ...     gpx_df.to_csv(file_path)
+    '''
+    handle = _Stage(points)
+    if not recording():
+        yield handle
+        return
+    start = perf_counter()
+    try:
+        yield handle
+    finally:
+        _timings.append(Timing(
+            name, perf_counter() - start, handle.points, getattr(_local, 'activity_id', None)
+        ))
+
+
+def timed(name, points=None):
+    '''
+    Decorator timing every call of a function as stage `name`
+
+    Parameters
+    ----------
+    name: str
+        stage name
+    points: callable (default=None)
+        maps the function's return value to trackpoints handled, e.g. len
+    '''
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name) as handle:
+                result = func(*args, **kwargs)
+                if points is not None:
+                    handle.points = points(result)
+            return result
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def activity(activity_id):
+    '''
+    Record timings inside the block and attribute them to one activity
+    '''
+    previous = getattr(_local, 'activity_id', None)
+    _local.activity_id = str(activity_id)
+    try:
+        yield
+    finally:
+        _local.activity_id = previous
+
+
+def mark():
+    '''
+    Position in this process's timings, see drain
+    '''
+    return len(_timings)
+
+
+def drain(start=0):
+    '''
+    Remove and return the timings recorded in this process since mark()
+
+    Parameters
+    ----------
+    start: int (default=0)
+        value returned by mark()
+
+    Returns
+    -------
+    list of Timing
+    '''
+    timings = _timings[start:]
+    del _timings[start:]
+    return timings
+
+
+def merge(timings):
+    '''
+    Add timings returned by drain() in another (worker) process
+    '''
+    _timings.extend(Timing(*timing) for timing in timings)
+
+
+def recorded():
+    return list(_timings)
+
+
+def reset():
+    del _timings[:]
+
+
+def summarize(timings=None):
+    '''
+    Aggregate statistics per stage
+
+    Parameters
+    ----------
+    timings: list of Timing (default=None)
+        timings of this process if None
+
+    Returns
+    -------
+    pandas.DataFrame
+        rows: stages in order of first call
+        cols: count, total_s, mean_s, p50_s, p95_s, max_s, points, points_per_s
+    '''
+    timings = _timings if timings is None else timings
+    by_stage = {}
+    for timing in timings:
+        by_stage.setdefault(timing.stage, []).append(timing)
+
+    rows = {}
+    for name, stage_timings in by_stage.items():
+        seconds = np.array([t.seconds for t in stage_timings])
+        points = [t.points for t in stage_timings if t.points is not None]
+        points_seconds = sum(t.seconds for t in stage_timings if t.points is not None)
+        rows[name] = {
+            'count': seconds.size,
+            'total_s': seconds.sum(),
+            'mean_s': seconds.mean(),
+            'p50_s': np.percentile(seconds, 50),
+            'p95_s': np.percentile(seconds, 95),
+            'max_s': seconds.max(),
+            'points': sum(points) if points else None,
+            'points_per_s': sum(points) / points_seconds if points and points_seconds else None,
+        }
+    return DataFrame.from_dict(rows, orient='index', columns=[
+        'count', 'total_s', 'mean_s', 'p50_s', 'p95_s', 'max_s', 'points', 'points_per_s'
+    ])
+
+
+def summarize_activities(timings=None):
+    '''
+    Seconds spent per activity and stage
+
+    Returns
+    -------
+    pandas.DataFrame
+        rows: activity IDs
+        cols: stages, plus `total_s`
+    '''
+    timings = _timings if timings is None else timings
+    activities = {}
+    for timing in timings:
+        if timing.activity_id is None:
+            continue
+        row = activities.setdefault(timing.activity_id, {})
+        row[timing.stage] = row.get(timing.stage, 0) + timing.seconds
+    activities_df = DataFrame.from_dict(activities, orient='index').fillna(0)
+    if not activities_df.empty:
+        activities_df['total_s'] = activities_df.sum(axis=1)
+    return activities_df
+
+
+def write_timings(file_path, timings=None):
+    '''
+    Write per-stage and per-activity statistics to a .json file
+    '''
+    timings = _timings if timings is None else timings
+    with open(file_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'stages': json.loads(summarize(timings).to_json(orient='index')),
+            'activities': json.loads(summarize_activities(timings).to_json(orient='index')),
+        }, f, indent=4)
+    assert os.path.isfile(file_path), FileNotFoundError
+
+
+def print_summary(title='Stage timings', timings=None):
+    '''
+    Display per-stage statistics to terminal
+
+    Returns
+    -------
+    std.out
+        rich.Table printed to terminal
+    '''
+    summary_df = summarize(timings)
+    table = Table(title=title.upper(), style='bold magenta')
+    table.add_column('Stage', justify='right', style='cyan', no_wrap=True)
+    for col in summary_df.columns:
+        table.add_column(col.title(), justify='left', style='cyan')
+    for name, row in summary_df.iterrows():
+        table.add_row(name, *[
+            '-' if val is None or val != val
+            else f'{int(val)}' if col in ['count', 'points', 'points_per_s']
+            else f'{val:.4f}'
+            for col, val in row.items()
+        ])
+
+    rich.print(table)
@@ -0,0 +1,113 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import GPXmanager as gm
+import TIMEhelper as th
+
+
+class WriterPool:
+    '''
+    Write enriched activity frames on background threads so output I/O
+    overlaps with parsing and enrichment of the next activities
+
+    At most `max_pending` frames are queued or being written; submit blocks
+    beyond that, which caps memory when writers fall behind. Finished
+    writes are collected on the caller's thread with completed() and
+    close(), so the caller alone updates shared state such as the manifest
+
+    Parameters
+    ----------
+    backup_dir: str
+        path to backup directory
+    activity_index: dict
+        activity ID -> backup directory, see JSONmanager.load_activity_index
+    extensions: iterable of str
+        passed to GPXmanager.write_to_id_dir
+    writers: int (default=2)
+        number of writer threads
+    max_pending: int (default=None)
+        frames queued or in flight before submit blocks; 2 * writers if None
+
+    Example
+    -------
+    >>> pool = WriterPool(backup_dir, activity_index, ('pkl', 'csv'))
+    >>> for gpx_path, gpx_df, error in em.iter_processed(gpx_files):
+    ...     pool.submit(gpx_df, gpx_path)
+    ...     for gpx_path, output_paths, error in pool.completed():
+    ...         ...
+    >>> for gpx_path, output_paths, error in pool.close():
+    ...     ...
+    '''
+    def __init__(self, backup_dir, activity_index, extensions, writers=2, max_pending=None):
+        self.backup_dir = backup_dir
+        self.activity_index = activity_index
+        self.extensions = tuple(extensions)
+        self.writers = writers
+        self._slots = threading.BoundedSemaphore(max_pending or 2 * writers)
+        self._executor = ThreadPoolExecutor(max_workers=writers, thread_name_prefix='writer')
+        self._pending = []
+        self.written = 0
+        self.failed = 0
+        self.outputs = 0
+
+    def _write(self, gpx_df, gpx_path):
+        try:
+            with th.activity(gm.activity_id_from_path(gpx_path)):
+                output_paths = gm.write_to_id_dir(
+                    gpx_df, gpx_path, self.backup_dir, self.activity_index,
+                    extensions=self.extensions, overwrite=True
+                )
+            return gpx_path, output_paths, None
+        except Exception as e:
+            return gpx_path, None, f'{type(e).__name__}: {e}'
+        finally:
+            self._slots.release()
+
+    def submit(self, gpx_df, gpx_path):
+        '''
+        Queue one frame for writing, blocking while max_pending frames are
+        already queued or being written
+        '''
+        with th.stage('write.wait'):
+            self._slots.acquire()
+        self._pending.append(self._executor.submit(self._write, gpx_df, gpx_path))
+
+    def _collect(self, futures):
+        for future in futures:
+            gpx_path, output_paths, error = future.result()
+            if error is None:
+                self.written += 1
+                self.outputs += len(output_paths)
+            else:
+                self.failed += 1
+            yield gpx_path, output_paths, error
+
+    def completed(self):
+        '''
+        Results of writes finished so far, without blocking
+
+        Yields
+        ------
+        tuple(str, dict or None, str or None)
+            gpx_path, output paths returned by write_to_id_dir (None on
+            failure), error message (None on success)
+        '''
+        done, pending = [], []
+        for future in self._pending:
+            (done if future.done() else pending).append(future)
+        self._pending = pending
+        yield from self._collect(done)
+
+    def close(self):
+        '''
+        Wait for every queued write and stop the writer threads
+
+        Yields
+        ------
+        tuple(str, dict or None, str or None)
+            see completed
+        '''
+        with th.stage('write.flush'):
+            self._executor.shutdown(wait=True)
+        pending, self._pending = self._pending, []
+        yield from self._collect(pending)
@@ -0,0 +1,60 @@
+'''
+Micro-benchmark: row-wise haversine apply vs. GPXcleaner.calculate_haversine
+
+>>> python3 benchmarks/haversine_benchmark.py --points 50000
+'''
+import os
+import sys
+import argparse
+from timeit import timeit
+
+import numpy as np
+import pandas as pd
+from haversine import haversine, Unit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import GPXcleaner as gc
+
+
+def synthetic_track(n, seed=0):
+    '''
+    Random-walk track of n points starting in Champaign, IL
+    '''
+    rng = np.random.default_rng(seed)
+    latitude = 40.1164 + np.cumsum(rng.normal(0, 5e-5, n))
+    longitude = -88.2434 + np.cumsum(rng.normal(0, 5e-5, n))
+    points_df = pd.DataFrame({'latitude': latitude, 'longitude': longitude})
+    points_df['proj_latitude'] = points_df['latitude'].shift(1).fillna(points_df['latitude'].iloc[0])
+    points_df['proj_longitude'] = points_df['longitude'].shift(1).fillna(points_df['longitude'].iloc[0])
+    return points_df
+
+
+def rowwise(points_df):
+    return points_df[['latitude', 'longitude', 'proj_latitude', 'proj_longitude']].apply(
+        lambda x: haversine((x[0], x[1]), (x[2], x[3]), unit=Unit.METERS), axis=1
+    )
+
+
+def vectorized(points_df):
+    return gc.calculate_haversine(
+        points_df['latitude'], points_df['longitude'],
+        points_df['proj_latitude'], points_df['proj_longitude']
+    )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--points', type=int, default=50_000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    points_df = synthetic_track(args.points)
+    assert np.allclose(rowwise(points_df), vectorized(points_df), rtol=1e-9, atol=1e-6),\
+        'vectorized distances differ from haversine package'
+
+    t_rowwise = timeit(lambda: rowwise(points_df), number=args.repeat) / args.repeat
+    t_vectorized = timeit(lambda: vectorized(points_df), number=args.repeat) / args.repeat
+    print(f'points:     {args.points}')
+    print(f'row-wise:   {t_rowwise * 1000:.2f} ms')
+    print(f'vectorized: {t_vectorized * 1000:.2f} ms')
+    print(f'speedup:    {t_rowwise / t_vectorized:.1f}x')
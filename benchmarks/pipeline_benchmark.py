@@ -0,0 +1,182 @@
+'''
+Offline benchmark of every gcfm.py stage on a synthetic export directory
+
+Stages are timed separately so regressions can be traced:
+    summaries     gather_user_stats/gather_exhaused_activities/gather_activities_data
+    parsing       GPXcleaner.gpx_to_dataframe
+    fit_decode    FITmanager.read_fit_fields
+    process       GPXmanager.raw_gpx_to_reuben_gpx (parse + FIT + enrichment)
+    enrichment    process minus parsing and fit_decode, per activity
+    id_routing    JSONmanager.load_activity_index + per-activity directory lookup
+    write_<fmt>   GPXmanager.write_to_id_dir, one stage per output format
+    dir_status_*  DIRhelper.get_dir_info for export and backup directories,
+                  uncached and from the per-directory stats cache
+
+>>> python3 benchmarks/pipeline_benchmark.py --activities 20 --points 3600 --output results.json
+'''
+import os
+import sys
+import json
+import shutil
+import argparse
+import platform
+import tempfile
+from time import perf_counter
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import GPXcleaner as gc
+import GPXmanager as gm
+import FITmanager as fm
+import JSONmanager as jm
+import CSVmanager as cm
+import DIRhelper as dh
+import SCANhelper as sh
+import TIMEhelper as th
+
+from synthetic import generate_export
+
+
+def timed(func, *args, **kwargs):
+    start = perf_counter()
+    result = func(*args, **kwargs)
+    return result, perf_counter() - start
+
+
+def run_benchmark(work_dir, activities=20, points=3600, snapshots=2, formats=('pkl', 'csv'), timezone='UTC'):
+    '''
+    Generate a synthetic export in work_dir and time every pipeline stage
+
+    Parameters
+    ----------
+    work_dir: str
+        scratch directory; export/ and backup/ are created inside
+    activities, points, snapshots:
+        passed to synthetic.generate_export
+    formats: iterable of str (default=('pkl', 'csv'))
+        keys of GPXmanager.WRITERS to time
+    timezone: str (default='UTC')
+        fixed so timezone inference does not skew enrichment timings
+
+    Returns
+    -------
+    dict
+        machine-readable results: environment, config and per-stage stats
+    '''
+    export_dir = f'{work_dir}/export'
+    backup_dir = f'{work_dir}/backup'
+    os.makedirs(backup_dir, exist_ok=True)
+
+    _, generate_s = timed(generate_export, export_dir, activities=activities, points=points, snapshots=snapshots)
+    durations = {}
+
+    inventory, scan_s = timed(sh.scan_export_dir, export_dir)
+    latest_inventory = sh.drop_superseded(inventory)
+    durations['scan_export_dir'] = [scan_s]
+
+    durations['summaries'] = [
+        timed(jm.gather_user_stats, export_dir, backup_dir, inventory=latest_inventory)[1],
+        timed(jm.gather_exhaused_activities, export_dir, backup_dir, inventory=latest_inventory)[1],
+        timed(cm.gather_activities_data, export_dir, backup_dir, inventory=latest_inventory)[1],
+    ]
+
+    gpx_files = [entry.path for _, entry in sorted(sh.resolve_latest_activities(inventory, kind='gpx').items())]
+
+    points_per_activity = []
+    for stage in ['parsing', 'fit_decode', 'process', 'enrichment', 'id_routing']:
+        durations[stage] = []
+    frames = {}
+    for gpx_file in gpx_files:
+        raw_df, parse_s = timed(gc.gpx_to_dataframe, gpx_file)
+        _, fit_s = timed(fm.read_fit_fields, fm.fit_path_from_gpx(gpx_file), fields=['timestamp', *gm.FIT_CHANNELS])
+        gpx_df, process_s = timed(gm.raw_gpx_to_reuben_gpx, gpx_file, timezone=timezone)
+
+        points_per_activity.append(raw_df.shape[0])
+        durations['parsing'].append(parse_s)
+        durations['fit_decode'].append(fit_s)
+        durations['process'].append(process_s)
+        durations['enrichment'].append(max(process_s - parse_s - fit_s, 0.0))
+        frames[gpx_file] = gpx_df
+
+    activity_index, load_s = timed(jm.load_activity_index, backup_dir)
+    for gpx_file in gpx_files:
+        _, route_s = timed(lambda: activity_index[gm.activity_id_from_path(gpx_file)])
+        durations['id_routing'].append(route_s)
+    durations['id_routing'][0] += load_s
+
+    for fmt in formats:
+        durations[f'write_{fmt}'] = [
+            timed(gm.write_to_id_dir, gpx_df, gpx_file, backup_dir, activity_index,
+                  extensions=(fmt,), overwrite=True)[1]
+            for gpx_file, gpx_df in frames.items()
+        ]
+
+    durations['dir_status_export'] = [
+        timed(lambda: dh.dir_info_to_dir_df(dh.get_dir_info(export_dir, use_cache=False)))[1]
+    ]
+    durations['dir_status_export_inventory'] = [
+        timed(lambda: dh.dir_info_to_dir_df(dh.get_dir_info(export_dir, inventory=inventory)))[1]
+    ]
+    durations['dir_status_backup'] = [
+        timed(lambda: dh.dir_info_to_dir_df(dh.get_dir_info(backup_dir, use_cache=False)))[1]
+    ]
+    # second run reuses per-directory stats cached by the first
+    dh.get_dir_info(backup_dir)
+    durations['dir_status_backup_cached'] = [timed(lambda: dh.dir_info_to_dir_df(dh.get_dir_info(backup_dir)))[1]]
+
+    # aggregated by TIMEhelper.summarize so statistics match gcfm --profile
+    point_stages = ['parsing', 'fit_decode', 'process', 'enrichment', *[f'write_{fmt}' for fmt in formats]]
+    timings = [
+        th.Timing(stage, seconds, points_per_activity[i] if stage in point_stages else None, None)
+        for stage, stage_durations in durations.items()
+        for i, seconds in enumerate(stage_durations)
+    ]
+    return {
+        'pipeline_version': gm.PIPELINE_VERSION,
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+        },
+        'config': {
+            'activities': activities,
+            'points': points,
+            'snapshots': snapshots,
+            'formats': list(formats),
+            'timezone': timezone,
+            'export_files': len(inventory),
+            'generate_s': generate_s,
+        },
+        'stages': json.loads(th.summarize(timings).to_json(orient='index')),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--activities', type=int, default=20)
+    parser.add_argument('--points', type=int, default=3600, help='trackpoints per activity')
+    parser.add_argument('--snapshots', type=int, default=2, help='export snapshots')
+    parser.add_argument('--formats', nargs='+', default=['pkl', 'csv'], choices=sorted(gm.WRITERS))
+    parser.add_argument('--output', default=None, help='JSON results file (default: stdout)')
+    parser.add_argument('--keep', default=None, metavar='DIR',
+                        help='generate in DIR and keep it instead of a temporary directory')
+    args = parser.parse_args()
+
+    work_dir = args.keep or tempfile.mkdtemp(prefix='gcfm_benchmark_')
+    try:
+        results = run_benchmark(
+            work_dir, activities=args.activities, points=args.points,
+            snapshots=args.snapshots, formats=args.formats
+        )
+    finally:
+        if args.keep is None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.output is None:
+        print(json.dumps(results, indent=2))
+    else:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,217 @@
+'''
+Synthetic gcexport-style export directory for offline benchmarking
+
+Layout mirrors what gcfm.py expects:
+
+    <export_dir>/
+        YYYY-MM-DD_garmin_connect_export_gpx/
+            activity_<id>.gpx, activities-<start>-<end>.json, activities.csv,
+            userstats.json, downloaded_ids.json
+        YYYY-MM-DD_garmin_connect_export_fit/
+            activity_<id>.fit, (same json/csv files)
+
+Every snapshot repeats the full history up to its date, like real exports.
+'''
+import os
+import csv
+import json
+import struct
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+
+ACTIVITY_TYPES = ['cycling', 'road_biking', 'virtual_ride', 'running', 'walking', 'indoor_rowing']
+FIT_EPOCH = datetime(1989, 12, 31, tzinfo=timezone.utc)
+
+GPX_HEADER = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<gpx creator="Garmin Connect" version="1.1" '
+    'xmlns="http://www.topografix.com/GPX/1/1" '
+    'xmlns:ns3="http://www.garmin.com/xmlschemas/TrackPointExtension/v1">\n'
+    '<trk><name>synthetic</name><trkseg>\n'
+)
+GPX_FOOTER = '</trkseg></trk></gpx>\n'
+
+_CRC_TABLE = [
+    0x0000, 0xCC01, 0xD801, 0x1400, 0xF001, 0x3C00, 0x2800, 0xE401,
+    0xA001, 0x6C00, 0x7800, 0xB401, 0x5000, 0x9C01, 0x8801, 0x4400,
+]
+
+
+def fit_crc(data, crc=0):
+    for byte in data:
+        tmp = _CRC_TABLE[crc & 0xF]
+        crc = (crc >> 4) & 0x0FFF
+        crc = crc ^ tmp ^ _CRC_TABLE[byte & 0xF]
+        tmp = _CRC_TABLE[crc & 0xF]
+        crc = (crc >> 4) & 0x0FFF
+        crc = crc ^ tmp ^ _CRC_TABLE[(byte >> 4) & 0xF]
+    return crc
+
+
+def synthetic_points(n, start, seed=0):
+    '''
+    Random-walk track of n points at 1 Hz starting in Champaign, IL
+
+    Returns
+    -------
+    dict of numpy.ndarray
+        latitude, longitude, elevation, heart_rate, cadence, power, temperature
+        and `time` (list of datetime)
+    '''
+    rng = np.random.default_rng(seed)
+    return {
+        'time': [start + timedelta(seconds=i) for i in range(n)],
+        'latitude': 40.1164 + np.cumsum(rng.normal(0, 5e-5, n)),
+        'longitude': -88.2434 + np.cumsum(rng.normal(0, 5e-5, n)),
+        'elevation': 220 + np.cumsum(rng.normal(0, 0.2, n)),
+        'heart_rate': np.clip(140 + np.cumsum(rng.normal(0, 1, n)), 60, 200).round(),
+        'cadence': np.clip(85 + rng.normal(0, 5, n), 0, 150).round(),
+        'power': np.clip(200 + rng.normal(0, 40, n), 0, 1500).round(),
+        'temperature': np.full(n, 21),
+    }
+
+
+def write_gpx(path, points):
+    '''
+    Write GPX with Garmin TrackPointExtension hr/cad children
+    '''
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(GPX_HEADER)
+        for i, t in enumerate(points['time']):
+            f.write(
+                f'<trkpt lat="{points["latitude"][i]:.7f}" lon="{points["longitude"][i]:.7f}">'
+                f'<ele>{points["elevation"][i]:.1f}</ele>'
+                f'<time>{t.strftime("%Y-%m-%dT%H:%M:%S.000Z")}</time>'
+                '<extensions><ns3:TrackPointExtension>'
+                f'<ns3:hr>{int(points["heart_rate"][i])}</ns3:hr>'
+                f'<ns3:cad>{int(points["cadence"][i])}</ns3:cad>'
+                '</ns3:TrackPointExtension></extensions></trkpt>\n'
+            )
+        f.write(GPX_FOOTER)
+
+
+def write_fit(path, points):
+    '''
+    Write minimal FIT activity file: file_id plus one record message per
+    point with timestamp, power, temperature and left_right_balance
+    '''
+    def timestamp(t):
+        return int((t - FIT_EPOCH).total_seconds())
+
+    body = b''
+    # file_id definition (local 0, global 0): type enum, time_created uint32
+    body += bytes([0x40, 0, 0]) + struct.pack('<H', 0) + bytes([2, 0, 1, 0x00, 4, 4, 0x86])
+    body += bytes([0x00]) + struct.pack('<BI', 4, timestamp(points['time'][0]))
+    # record definition (local 1, global 20)
+    body += bytes([0x41, 0, 0]) + struct.pack('<H', 20) + bytes([4, 253, 4, 0x86, 7, 2, 0x84, 13, 1, 0x01, 30, 1, 0x02])
+    for i, t in enumerate(points['time']):
+        body += bytes([0x01]) + struct.pack(
+            '<IHbB', timestamp(t), int(points['power'][i]), int(points['temperature'][i]), 50
+        )
+
+    header = struct.pack('<BBHI4s', 12, 16, 2132, len(body), b'.FIT')
+    data = header + body
+    with open(path, 'wb') as f:
+        f.write(data + struct.pack('<H', fit_crc(data)))
+
+
+def _activity_summary(activity_id, activity_type, start, n_points):
+    return {
+        'activityId': activity_id,
+        'activityName': f'Synthetic {activity_type}',
+        'startTimeLocal': start.strftime('%Y-%m-%d %H:%M:%S'),
+        'activityType': {'typeKey': activity_type, 'typeId': 1},
+        'distance': float(n_points * 5),
+        'duration': float(n_points),
+        'elevationGain': 100.0,
+        'averageHR': 140.0,
+        'maxHR': 180.0,
+        'calories': 500.0,
+        'summarizedDiveInfo': {'summarizedDiveGases': []},
+    }
+
+
+def _csv_row(summary):
+    return {
+        'Activity ID': summary['activityId'],
+        'Activity Name': summary['activityName'],
+        'Start Time': summary['startTimeLocal'],
+        'Activity Type': summary['activityType']['typeKey'],
+        'Duration (s)': summary['duration'],
+        'Distance (km)': summary['distance'] / 1000,
+        'Average HR': summary['averageHR'],
+        'Max. HR': summary['maxHR'],
+        'Calories': summary['calories'],
+    }
+
+
+def generate_export(export_dir, activities=20, points=3600, snapshots=2, page_size=100, seed=0):
+    '''
+    Generate a synthetic export directory
+
+    Parameters
+    ----------
+    export_dir: str
+        directory to create snapshots in
+    activities: int (default=20)
+        activities in the newest snapshot
+    points: int (default=3600)
+        trackpoints per activity (1 Hz)
+    snapshots: int (default=2)
+        dated export snapshots; older ones hold a prefix of the history
+    page_size: int (default=100)
+        activities per activities-*.json container
+    seed: int (default=0)
+
+    Returns
+    -------
+    list of str
+        snapshot directory names
+    '''
+    os.makedirs(export_dir, exist_ok=True)
+    first_start = datetime(2023, 1, 1, 13, 0, tzinfo=timezone.utc)
+    summaries = [
+        _activity_summary(
+            10_000_000 + i,
+            ACTIVITY_TYPES[i % len(ACTIVITY_TYPES)],
+            first_start + timedelta(days=i),
+            points
+        )
+        for i in range(activities)
+    ]
+
+    snapshot_dirs = []
+    for s in range(snapshots):
+        # each snapshot contains the history up to its export date
+        n = activities * (s + 1) // snapshots
+        export_date = (first_start + timedelta(days=n)).strftime('%Y-%m-%d')
+        for kind in ['gpx', 'fit']:
+            snapshot = f'{export_date}_garmin_connect_export_{kind}'
+            snapshot_dirs.append(snapshot)
+            snapshot_path = f'{export_dir}/{snapshot}'
+            os.makedirs(snapshot_path, exist_ok=True)
+
+            for page in range(0, n, page_size):
+                with open(f'{snapshot_path}/activities-{page}-{min(page + page_size, n) - 1}.json', 'w') as f:
+                    json.dump(summaries[page:page + page_size], f)
+            with open(f'{snapshot_path}/activities.csv', 'w', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=list(_csv_row(summaries[0])))
+                writer.writeheader()
+                writer.writerows(_csv_row(summary) for summary in summaries[:n])
+            with open(f'{snapshot_path}/userstats.json', 'w') as f:
+                json.dump({'userMetrics': [{'totalActivities': n, 'totalDistance': 0.0,
+                    'totalDuration': 0.0, 'totalCalories': 0.0, 'totalElevationGain': 0.0}]}, f)
+            with open(f'{snapshot_path}/downloaded_ids.json', 'w') as f:
+                json.dump({'ids': [summary['activityId'] for summary in summaries[:n]]}, f)
+
+            for i, summary in enumerate(summaries[:n]):
+                start = datetime.strptime(summary['startTimeLocal'], '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+                track = synthetic_points(points, start, seed=seed + i)
+                if kind == 'gpx':
+                    write_gpx(f"{snapshot_path}/activity_{summary['activityId']}.gpx", track)
+                else:
+                    write_fit(f"{snapshot_path}/activity_{summary['activityId']}.fit", track)
+
+    return snapshot_dirs
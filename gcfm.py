@@ -1,14 +1,16 @@
 import os
-import sys
-from datetime import datetime
+import argparse
 
-from alive_progress import alive_bar
-from numpy import array, array_equal
+import DOWNLOADmanager as dm
 
-import JSONmanager as jm
-import GPXmanager as gm
-import CSVmanager as cm
-import DIRhelper as dh
+# the pipeline modules pull in pandas/numpy/rich; they are imported in
+# __main__ once arguments are parsed, so --help and argument errors return
+# immediately
+
+
+# keys of GPXmanager.WRITERS, listed here so parsing arguments does not
+# import GPXmanager
+OUTPUT_FORMATS = ['archive', 'csv', 'curves', 'parquet', 'pkl', 'sqlite', 'summary', 'tiles']
 
 
 def validate_arguments(*args):
@@ -42,6 +44,114 @@ def validate_arguments(*args):
     return args[0]
 
 
+def record_writes(results, manifest, backup_dir, compact=False):
+    '''
+    Record finished background writes in the processing manifest
+
+    Parameters
+    ----------
+    results: iterable
+        yielded by WRITEmanager.WriterPool.completed/close
+    manifest: dict
+        returned by MANIFESTmanager.load_manifest
+    backup_dir: str
+        path to backup directory
+    compact: bool (default=False)
+        whether frames were written with the compact schema
+
+    Returns
+    -------
+    list of str
+        error messages of failed writes
+    '''
+    import MANIFESTmanager as mm
+
+    errors = []
+    for gpx_file, output_paths, error in results:
+        if error is None:
+            mm.record_activity(manifest, gpx_file, backup_dir, output_paths, compact=compact)
+        else:
+            errors.append(f'{os.path.basename(gpx_file)}: {error}')
+    return errors
+
+
+def parse_arguments():
+    '''
+    Parse command line arguments
+
+    Returns
+    -------
+    argparse.Namespace
+        directories: list(export_dir, backup_dir)
+        workers: int, number of processes used to process activities
+        timezone: str or None, timezone for local activity times
+        formats: list of str, output formats for activity frames
+        compact: bool, write activity frames with the compact schema
+        profile: str or None, path cProfile stats are dumped to
+        writers: int, number of threads writing output files
+        process_only: bool, skip downloading and process export_dir as is
+        source: str, download adapter (key of DOWNLOADmanager.SOURCES)
+        source_dir: str or None, directory the download adapter reads from
+    '''
+    parser = argparse.ArgumentParser(
+        description='Back up Garmin Connect exports to a backup directory'
+    )
+    parser.add_argument(
+        'directories', nargs='*',
+        help='paths to export directory and backup directory (any order)'
+    )
+    parser.add_argument(
+        '--workers', type=int, default=1, metavar='N',
+        help='number of processes used to parse and enrich activities (default: 1)'
+    )
+    parser.add_argument(
+        '--writers', type=int, default=2, metavar='N',
+        help='number of threads writing output files in the background (default: 2)'
+    )
+    parser.add_argument(
+        '--timezone', default=None, metavar='TZ',
+        help='IANA timezone for local activity times (default: inferred from '
+             'the first point with timezonefinder, else America/Chicago)'
+    )
+    parser.add_argument(
+        '--formats', nargs='+', default=['pkl', 'csv', 'summary', 'tiles'], choices=OUTPUT_FORMATS,
+        help='output formats for activity frames (default: pkl csv summary tiles); parquet '
+             '(requires pyarrow) and sqlite also write the activity summary tables; '
+             'curves caches mean-maximal power/HR/speed curves per activity; summary '
+             'appends per-activity totals to activity_summaries.jsonl; tiles indexes '
+             'the grid tiles every activity passes through in tile_index.jsonl'
+    )
+    parser.add_argument(
+        '--compact', action='store_true',
+        help='write activity frames with compact dtypes: one tz-aware time column, '
+             'float32 metrics, small integer HR/cadence/power, activity id in frame attrs '
+             '(written as a column by csv and parquet)'
+    )
+    parser.add_argument(
+        '--profile', nargs='?', const='gcfm.prof', default=None, metavar='PATH',
+        help='dump cProfile stats to PATH (default: gcfm.prof) and per-stage/per-activity '
+             'timings to PATH.timings.json; with --workers > 1 only the main process is profiled'
+    )
+    parser.add_argument(
+        '--process-only', action='store_true',
+        help='skip downloading and process the existing export directory'
+    )
+    parser.add_argument(
+        '--source', default='gcexport', choices=sorted(dm.SOURCES),
+        help='where new exports come from: gcexport (Garmin Connect download) '
+             'or local (copy snapshots from --source-dir) (default: gcexport)'
+    )
+    parser.add_argument(
+        '--source-dir', default=None, metavar='DIR',
+        help=f'garmin-connect-export checkout for gcexport (default: {dm.DEFAULT_GCEXPORT_DIR}) '
+             'or directory of export snapshots for local'
+    )
+    cli_args = parser.parse_args()
+    if cli_args.source == 'local' and cli_args.source_dir is None and not cli_args.process_only:
+        parser.error('--source local requires --source-dir')
+    return cli_args
+
+
 if __name__ == '__main__':
     
     #################################################
@@ -49,36 +159,69 @@ if __name__ == '__main__':
     #################################################
     
     # validate arguments in command line
-    args = validate_arguments(sys.argv[1:])
+    cli_args = parse_arguments()
+    args = validate_arguments(cli_args.directories)
+
+    import cProfile
+
+    from alive_progress import alive_bar
+    from numpy import array, array_equal
+
+    import JSONmanager as jm
+    import GPXmanager as gm
+    import CSVmanager as cm
+    import DIRhelper as dh
+    import EXPORTmanager as em
+    import MANIFESTmanager as mm
+    import SCANhelper as sh
+    import TIMEhelper as th
+    import WRITEmanager as wm
+
+    assert set(OUTPUT_FORMATS) == set(gm.WRITERS), 'OUTPUT_FORMATS out of sync with GPXmanager.WRITERS'
+
+    # stage timings are printed at the end of every run
+    th.enable()
+
+    if cli_args.profile is not None:
+        profile_path = os.path.abspath(cli_args.profile)
+        profiler = cProfile.Profile()
+        profiler.enable()
     
     # detect which argument points to which directory
     backup_dir = args['backup' in args[1]]
     export_dir = args[backup_dir == args[0]]
 
-    # gathering data from Garmin Connect
+    # summary tables are always pickled; parquet/sqlite copies are opt-in
+    extensions = tuple(cli_args.formats)
+    summary_formats = ('pkl', *[f for f in extensions if f in ['parquet', 'sqlite']])
+
+    # gathering data from Garmin Connect (or another source); skipped with
+    # --process-only, e.g. when re-running after a crash
     USERNAME = '******'
     FAUXWORD = '******'
     COUNT = 'all'
-    GC_DIR_PATH = f"{datetime.strftime(datetime.today(), '%Y-%m-%d')}_garmin_connect_export"
 
-    os.chdir('../garmin-connect-export')
-    if not f"{GC_DIR_PATH}_gpx" in os.listdir(export_dir):
-        gpx_cmd = f"python3 gcexport.py --username={USERNAME} --password={FAUXWORD} -c={COUNT}"
-        os.system(gpx_cmd)
-        os.system(f"mv {GC_DIR_PATH} {export_dir}/{GC_DIR_PATH}_gpx")
-    if not f"{GC_DIR_PATH}_fit" in os.listdir(export_dir):
-        fit_cmd = f"python3 gcexport.py --username={USERNAME} --password={FAUXWORD} -c={COUNT} -f='original' --unzip"
-        os.system(fit_cmd)
-        os.system(f"mv {GC_DIR_PATH} {export_dir}/{GC_DIR_PATH}_fit")
-    os.chdir('../garmin-connect-file-manager')
+    if not cli_args.process_only:
+        dm.SOURCES[cli_args.source](
+            os.path.abspath(export_dir),
+            source_dir=cli_args.source_dir,
+            username=USERNAME,
+            password=FAUXWORD,
+            count=COUNT
+        )
 
 
     #################################################
     ### printing information for export directory ###
     #################################################
     
+    # single inventory pass shared by every export directory reader; the
+    # summary readers skip snapshots fully contained in a newer one
+    inventory = sh.scan_export_dir(export_dir)
+    latest_inventory = sh.drop_superseded(inventory)
+
     print()
-    dh.directory_status(export_directory=export_dir)
+    dh.directory_status(inventory=inventory, export_directory=export_dir)
     print()
 
 
@@ -99,19 +242,19 @@ if __name__ == '__main__':
     ) as bar:
 
         bar.text = '  -> Gathering user statistics'
-        total_activities = jm.gather_user_stats(export_dir, backup_dir)
+        total_activities = jm.gather_user_stats(export_dir, backup_dir, inventory=latest_inventory)
         bar()
 
         bar.text = '  -> Gathering activity IDs'
-        activityIDs = jm.gather_activity_ids(export_dir)
+        activityIDs = jm.gather_activity_ids(export_dir, inventory=latest_inventory)
         bar()
 
         bar.text = '  -> Gathering JSON activities'
-        activity_df_ids = jm.gather_exhaused_activities(export_dir, backup_dir)
+        activity_df_ids = jm.gather_exhaused_activities(export_dir, backup_dir, formats=summary_formats, inventory=latest_inventory)
         bar()
 
         bar.text = '  -> Gathering CSV activities'
-        csv_num_rows = cm.gather_activities_data(export_dir, backup_dir)
+        csv_num_rows = cm.gather_activities_data(export_dir, backup_dir, formats=summary_formats, inventory=latest_inventory)
         bar()
 
         # ensuring consistency in number of activities
@@ -130,36 +273,53 @@ if __name__ == '__main__':
     ##### moving export data to backup folders ######
     #################################################
     
-    for sub_dir in sorted(os.listdir(export_dir)):
-        if sub_dir.endswith('_gpx'):
-            gpx_files = map(
-                    lambda g: f'{export_dir}/{sub_dir}/{g}',
-                    filter(
-                        lambda f: f.endswith('.gpx'),
-                        os.listdir(f'{export_dir}/{sub_dir}')
-                        )
+    activity_index = jm.load_activity_index(backup_dir)
+    manifest = mm.load_manifest(backup_dir)
+
+    # newest snapshot wins for every activity; unchanged activities are skipped
+    latest_gpx = sh.resolve_latest_activities(inventory, kind='gpx')
+    gpx_files = [
+        entry.path
+        for _, entry in sorted(latest_gpx.items())
+        if not mm.is_processed(manifest, entry.path, backup_dir, extensions, compact=cli_args.compact)
+    ]
+
+    # outputs are written on background threads while the next activities
+    # are processed; writes finish (and are recorded) in completion order
+    writer_pool = wm.WriterPool(backup_dir, activity_index, extensions, writers=cli_args.writers)
+    write_errors = []
+
+    try:
+        with alive_bar(
+            total=len(gpx_files),
+            dual_line=True,
+            title='Exporting activities  ',
+            spinner='waves2',
+            bar='filling',
+            monitor='[{percent:.2%}] {count}/{total}',
+            stats='(ETA: {eta})',
+            force_tty=True,
+            ctrl_c=True) as bar:
+            for gpx_file, gpx_df, error in em.iter_processed(
+                    gpx_files, workers=cli_args.workers, timezone=cli_args.timezone,
+                    compact=cli_args.compact):
+                write_errors += record_writes(writer_pool.completed(), manifest, backup_dir, compact=cli_args.compact)
+                if error is None:
+                    writer_pool.submit(gpx_df, gpx_file)
+                else:
+                    bar.text = "\t< No GPX Points > {}".format(
+                        gpx_file[gpx_file.rfind('_') + 1 : gpx_file.find('.gpx')]
                     )
-            with alive_bar(
-                total=len(os.listdir(f'{export_dir}/{sub_dir}')),
-                dual_line=True,
-                title=f"Exporting {datetime.strptime(sub_dir[:sub_dir.find('_')], '%Y-%m-%d').strftime('%b %d, %Y')}",
-                spinner='waves2',
-                bar='filling',
-                monitor='[{percent:.2%}] {count}/{total}',
-                stats='(ETA: {eta})',
-                force_tty=True,
-                ctrl_c=True) as bar:
-                for gpx_file in gpx_files:
-                    try:
-                        gm.raw_gpx_to_reuben_gpx(gpx_file)
-                        gm.write_to_id_dir(gpx_file, backup_dir, extension='pkl')
-                        gm.write_to_id_dir(gpx_file, backup_dir, extension='csv')
-                        bar()
-                    except:
-                        bar.text = "\t< No GPX Points > {}".format(
-                            gpx_file[gpx_file.rfind('_') + 1 : gpx_file.find('.gpx')]
-                        )
-                        continue
+                    continue
+                bar()
+    finally:
+        write_errors += record_writes(writer_pool.close(), manifest, backup_dir, compact=cli_args.compact)
+        mm.save_manifest(manifest, backup_dir)
+
+    print(f'  -> Wrote {writer_pool.written} activities ({writer_pool.outputs} outputs) '
+          f'with {cli_args.writers} writer threads, {writer_pool.failed} failed')
+    for write_error in write_errors:
+        print(f'\t< Write failed > {write_error}')
 
 
     #################################################
@@ -170,6 +330,15 @@ if __name__ == '__main__':
     dh.directory_status(backup_directory=backup_dir)
     print()
 
+    # where the run spent its time, per stage
+    th.print_summary()
+    print()
+
+    if cli_args.profile is not None:
+        profiler.disable()
+        profiler.dump_stats(profile_path)
+        th.write_timings(f'{profile_path}.timings.json')
+
 
     #################################################
     ### process complete - happy programming mate ###
@@ -4,8 +4,6 @@ import math
 
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
 
 
 def angleFromCoordinate(cols_list):
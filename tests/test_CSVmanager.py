@@ -0,0 +1,39 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import CSVmanager as cm
+import SCANhelper as sh
+
+
+def write_activities_csv(export_dir, export, rows):
+    os.makedirs(f'{export_dir}/{export}', exist_ok=True)
+    with open(f'{export_dir}/{export}/activities.csv', 'w', encoding='utf-8') as f:
+        f.write('Activity ID,Activity Name\n')
+        f.writelines(f'{activity_id},{name}\n' for activity_id, name in rows)
+
+
+def read_names(export_dir, chunksize):
+    inventory = sh.select(sh.scan_export_dir(export_dir), kind='csv', prefix='activities')
+    chunks = cm.iter_activity_chunks(inventory, chunksize=chunksize)
+    return [
+        (activity_id, name)
+        for chunk in chunks
+        for activity_id, name in zip(chunk['Activity ID'], chunk['Activity Name'])
+    ]
+
+
+def test_duplicate_across_chunk_boundary_keeps_first_row(tmp_path):
+    # activity 2 repeats in rows 2 and 3, which fall in different chunks of 2
+    write_activities_csv(tmp_path, '2023-01-02_garmin_connect_export', [
+        (1, 'a'), (2, 'first'), (2, 'second'), (3, 'c'),
+    ])
+    by_chunks = read_names(tmp_path, chunksize=2)
+    assert by_chunks == [(1, 'a'), (2, 'first'), (3, 'c')]
+    assert read_names(tmp_path, chunksize=1000) == by_chunks
+
+
+def test_newest_snapshot_wins(tmp_path):
+    write_activities_csv(tmp_path, '2023-01-02_garmin_connect_export', [(1, 'old'), (2, 'b')])
+    write_activities_csv(tmp_path, '2023-01-08_garmin_connect_export', [(1, 'new')])
+    assert sorted(read_names(tmp_path, chunksize=1)) == [(1, 'new'), (2, 'b')]